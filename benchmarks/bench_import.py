@@ -0,0 +1,74 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmark of the import time of the command-line tools and of each backend.
+
+Each module is imported in a fresh interpreter with "python -X importtime", and the
+cumulative import time, the heavy dependencies imported and the slowest top-level
+imports are reported.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat <n>] [--top <n>] [<module> ...]
+"""
+
+import argparse
+import subprocess
+import sys
+
+DEFAULT_MODULES = (
+    'replace_landsurface.hres_ic',
+    'replace_landsurface.hres_eccb',
+    'replace_landsurface.replace_landsurface_with_FF_IC',
+    'replace_landsurface.replace_landsurface_with_ERA5land_IC',
+    'replace_landsurface.replace_landsurface_with_BARRA2R_IC',
+)
+HEAVY_MODULES = ('iris', 'mule', 'numpy', 'pandas', 'xarray')
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter, returning the cumulative time (in us) of each top-level
+    import and the names of all the modules imported.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        # Top-level imports are not indented
+        if not name.startswith('  '):
+            times[name.strip()] = int(cumulative)
+    return times, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='Number of slowest top-level imports to show')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            runs = [import_times(module) for _ in range(args.repeat)]
+        except ImportError as e:
+            print(f'{module}: cannot be imported ({e})')
+            continue
+        best, imported = min(runs, key=lambda run: sum(run[0].values()))
+        heavy = [name for name in HEAVY_MODULES if name in imported]
+        print(f'{module}: {sum(best.values())/1e3:.1f} ms, heavy dependencies: {", ".join(heavy) or "none"}')
+        for name, cumulative in sorted(best.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'    {cumulative/1e3:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Micro-benchmark of the merge of the high-resolution data into the current data of a field.
+
+Compares the peak memory (tracemalloc) and the time of the previous merge
+(scaling then np.where) and of merge_data, on random data with NaN over the sea.
+
+Usage:
+    python benchmarks/bench_merge.py [--size <ny> <nx>] [--levels <n>] [--land-fraction <f>] [--repeat <n>]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from replace_landsurface.merge import merge_data
+
+
+def merge_where(current_data, data, multiplier=None):
+    """ The merge as previously done in the ERA5-land and BARRA2-R swaps."""
+    if multiplier is not None:
+        data = data * multiplier
+    return np.where(np.isnan(data), current_data, data)
+
+
+def measure(merge, current_data, data, multiplier, repeat):
+    """ Return the best time and the peak memory (in bytes) allocated by a merge."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        merge(current_data, data, multiplier)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = merge(current_data, data, multiplier)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, nargs=2, default=[2000, 2000], metavar=('NY', 'NX'))
+    parser.add_argument('--levels', type=int, default=4, help='Number of soil levels (multi-level source slab)')
+    parser.add_argument('--land-fraction', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    current_data = rng.random(args.size)
+    data = rng.random([args.levels] + args.size, dtype=np.float32)
+    data[:, rng.random(args.size) > args.land_fraction] = np.nan
+    field_mib = current_data.nbytes / 2**20
+    print(f'Field {args.size[0]}x{args.size[1]} ({field_mib:.1f} MiB), land fraction {args.land_fraction}')
+
+    for name, multiplier in (('scaled', 250.), ('unscaled', None)):
+        results = {}
+        for merge in (merge_where, merge_data):
+            best, peak, results[merge.__name__] = measure(merge, current_data, data[0], multiplier, args.repeat)
+            print(f'{name:>9} {merge.__name__:>12}: {best*1e3:8.1f} ms, peak {peak/2**20:7.1f} MiB '
+                  f'({peak/2**20/field_mib:.2f} fields)')
+        same = results['merge_where'].tobytes() == results['merge_data'].tobytes()
+        print(f'{name:>9} results identical: {same}')
+
+
+if __name__ == '__main__':
+    main()
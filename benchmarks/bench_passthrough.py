@@ -0,0 +1,88 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmark the writing of a start dump (or ec_cb file) with its land/surface fields replaced.
+
+Compares the full rewrite with mule, the rewrite copying the unchanged fields as
+raw bytes and the in-place patch of the replaced records. The land/surface fields
+are replaced with their own data, so the three outputs hold the same data.
+
+Usage:
+    python benchmarks/bench_passthrough.py <start_dump> [--outdir <dir>] [--repeat <n>]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import mule
+import numpy as np
+
+from replace_landsurface.patch import passthrough_fields, patch_fields
+
+
+class ReplaceOperator(mule.DataOperator):
+    """ Mule operator for replacing the data"""
+    def __init__(self):
+        pass
+    def new_field(self, sources):
+        return sources[0]
+    def transform(self, sources, result):
+        return sources[1]
+
+
+def write_mule(mf_in, ff_in, ff_out, replacements):
+    replace = ReplaceOperator()
+    replaced = {id(f): data for f, data in replacements}
+    mf_out = mf_in.copy()
+    for f in mf_in.fields:
+        mf_out.fields.append(replace([f, replaced[id(f)]]) if id(f) in replaced else f)
+    mf_out.validate = lambda *args, **kwargs: True
+    mf_out.to_file(ff_out)
+    return True
+
+
+def check_output(ff_out, replacements):
+    """ Check that the replaced fields of the output hold the expected data."""
+    expected = [data for f, data in replacements]
+    found = [f.get_data() for f in mule.load_umfile(ff_out).fields if f.lbuser4 in (9, 20, 24)]
+    return len(found) == len(expected) and all(np.array_equal(a, b) for a, b in zip(found, expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='UM start dump or ec_cb file')
+    parser.add_argument('--outdir', default=None, help='Directory for the output files (default: temporary directory)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    mf_in = mule.load_umfile(args.file)
+    replacements = [(f, f.get_data()) for f in mf_in.fields if f.lbuser4 in (9, 20, 24)]
+    size = os.path.getsize(args.file)
+    print(f'{args.file}: {len(mf_in.fields)} fields, {len(replacements)} replaced, {size/2**20:.1f} MiB')
+
+    writers = {'mule': write_mule, 'passthrough': passthrough_fields, 'patch': patch_fields}
+    with tempfile.TemporaryDirectory(dir=args.outdir) as outdir:
+        for name, writer in writers.items():
+            ff_out = os.path.join(outdir, name)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                written = writer(mf_in, args.file, ff_out, replacements)
+                times.append(time.perf_counter() - start)
+                if not written:
+                    break
+            if not written:
+                print(f'{name:>12}: not applicable to this file')
+                continue
+            ok = 'ok' if check_output(ff_out, replacements) else 'MISMATCH'
+            print(f'{name:>12}: best {min(times):.3f} s, mean {np.mean(times):.3f} s '
+                  f'({os.path.getsize(ff_out)/2**20:.1f} MiB, {ok})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import synthetic  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--synthetic-size", type=int, nargs=2, default=[200, 200], metavar=("NLAT", "NLON"),
+                     help="Size of the synthetic domain of the benchmarks")
+    parser.addoption("--synthetic-levels", type=int, default=10,
+                     help="Number of levels of the atmospheric fields of the synthetic start dumps")
+
+
+@pytest.fixture(scope="session")
+def synthetic_data(request, tmp_path_factory):
+    """
+    Synthetic input data (see synthetic.generate), with the swap modules pointed at its archives.
+    """
+    pytest.importorskip("mule")
+    from replace_landsurface import cache, replace_landsurface_with_BARRA2R_IC, replace_landsurface_with_ERA5land_IC
+
+    nlat, nlon = request.config.getoption("--synthetic-size")
+    levels = request.config.getoption("--synthetic-levels")
+    paths = synthetic.generate(tmp_path_factory.mktemp("synthetic").as_posix(), nlat, nlon, levels=levels)
+    rose_data = paths['rose_data']
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("ROSE_DATA", rose_data)
+        for name in ("REPLACE_LANDSURFACE_CATALOGUE", cache.CACHE_DIR_ENV, cache.SUBSET_CACHE_SIZE_ENV):
+            mp.delenv(name, raising=False)
+        for module in (replace_landsurface_with_ERA5land_IC, replace_landsurface_with_BARRA2R_IC):
+            module.configure()
+        yield paths
+    for module in (replace_landsurface_with_ERA5land_IC, replace_landsurface_with_BARRA2R_IC):
+        module.configure()
+
+
+@pytest.fixture
+def ic_file(synthetic_data, tmp_path):
+    """
+    Path (with ".tmp" appended) to a copy of the synthetic start dump, as passed to the swaps.
+    """
+    ff_in = tmp_path / "astart"
+    shutil.copyfile(synthetic_data['file'], ff_in)
+    return Path(ff_in.as_posix() + ".tmp")
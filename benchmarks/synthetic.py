@@ -0,0 +1,281 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Generator of synthetic input data, to run and benchmark the land/surface swaps
+away from the NCI archives.
+
+Writes, for a regular lat/lon domain of configurable size:
+  - a NetCDF land/sea mask of the domain
+  - a UM start dump (also usable as ec_cb file) and a matching high-resolution
+    start dump, holding the land/surface fields and some atmospheric fields
+  - ERA5-land and BARRA2-R style archives laid out as in $ROSE_DATA/etc/era5_land
+    and $ROSE_DATA/etc/barra_r2, covering the domain (with a margin)
+
+Usage:
+    python benchmarks/synthetic.py <outdir> [--size <nlat> <nlon>] [--levels <n>] [--date <YYYYmmddHHMM>]
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+# UM real missing data indicator
+RMDI = -1073741824.0
+
+# STASH codes of the atmospheric fields added to the start dumps (u, v, theta, specific humidity)
+ATMOS_STASH = (2, 3, 4, 10)
+
+# ERA5-land variables and BARRA2-R variables (with their frequency and number of soil levels)
+ERA5LAND_VARIABLES = ('skt', 'swvl1', 'swvl2', 'swvl3', 'swvl4', 'stl1', 'stl2', 'stl3', 'stl4')
+BARRA_VARIABLES = {'ts': ('1hr', 1), 'mrsol': ('3hr', 4), 'tsl': ('3hr', 4)}
+
+
+def make_grid(nlat, nlon, lat0=-40., lon0=140., spacing=0.1):
+    """
+    Coordinates (south to north, west to east) of a regular lat/lon domain.
+    """
+    lats = np.round(lat0 + spacing * np.arange(nlat), 6)
+    lons = np.round(lon0 + spacing * np.arange(nlon), 6)
+    return lats, lons
+
+
+def make_land(nlat, nlon, land_fraction, rng):
+    """
+    Land/sea mask with a smooth coastline and the given fraction of land points.
+    """
+    y, x = np.meshgrid(np.linspace(0, 3 * np.pi, nlat), np.linspace(0, 3 * np.pi, nlon), indexing='ij')
+    relief = np.sin(x) * np.cos(y) + 0.3 * rng.random((nlat, nlon))
+    return relief >= np.quantile(relief, 1. - land_fraction)
+
+
+def _times(date, freq_hours, ntimes=4):
+    """
+    Times every freq_hours around a date (the date is included).
+    """
+    start = np.datetime64(datetime.strptime(date, "%Y%m%d%H%M")) - np.timedelta64(freq_hours, 'h')
+    return start + np.arange(ntimes) * np.timedelta64(freq_hours, 'h')
+
+
+def _archive_grid(lats, lons, margin):
+    """
+    Coordinates of an archive grid covering the domain with a margin (same spacing).
+    """
+    spacing = lats[1] - lats[0]
+    alats = np.round(lats[0] + spacing * np.arange(-margin, lats.size + margin), 6)
+    alons = np.round(lons[0] + spacing * np.arange(-margin, lons.size + margin), 6)
+    return alats, alons
+
+
+def _archive_data(shape, land, margin, rng, low, high):
+    """
+    Random float32 data over an archive grid, missing (NaN) over the sea and the margin.
+    """
+    data = rng.uniform(low, high, shape).astype(np.float32)
+    sea = np.ones(shape[-2:], dtype=bool)
+    sea[margin:margin + land.shape[0], margin:margin + land.shape[1]] = ~land
+    data[..., sea] = np.nan
+    return data
+
+
+def write_mask(fname, lats, lons, land):
+    """
+    Write the land/sea mask of the domain to a NetCDF file.
+    """
+    ds = xr.Dataset(
+        {'land_binary_mask': (('latitude', 'longitude'), land.astype('i1'))},
+        coords={'latitude': lats, 'longitude': lons},
+    )
+    ds['latitude'].attrs['standard_name'] = 'latitude'
+    ds['longitude'].attrs['standard_name'] = 'longitude'
+    ds.to_netcdf(fname)
+
+
+def write_era5land_archive(rose_data, lats, lons, land, date, rng, margin=5):
+    """
+    Write ERA5-land style files (one per variable, latitudes north to south) covering the domain.
+    """
+    yyyymm = date[:6]
+    alats, alons = _archive_grid(lats, lons, margin)
+    times = _times(date, 1)
+    for var in ERA5LAND_VARIABLES:
+        low, high = (0.05, 0.45) if var.startswith('swvl') else (270., 310.)
+        data = _archive_data((times.size, alats.size, alons.size), land, margin, rng, low, high)
+        ds = xr.Dataset(
+            {var: (('time', 'latitude', 'longitude'), data[:, ::-1, :])},
+            coords={'time': times, 'latitude': alats[::-1], 'longitude': alons},
+        )
+        outdir = os.path.join(rose_data, 'etc', 'era5_land', var, date[:4])
+        os.makedirs(outdir, exist_ok=True)
+        ds.to_netcdf(os.path.join(outdir, f'{var}_era5-land_oper_sfc_{yyyymm}01-{yyyymm}28.nc'))
+
+
+def write_barra_archive(rose_data, lats, lons, land, date, rng, margin=5):
+    """
+    Write BARRA2-R style files (one per variable, latitudes south to north) covering the domain.
+    """
+    yyyymm = date[:6]
+    alats, alons = _archive_grid(lats, lons, margin)
+    for var, (freq, nlayers) in BARRA_VARIABLES.items():
+        times = _times(date, int(freq[0]))
+        low, high = (5., 100.) if var == 'mrsol' else (270., 310.)
+        if nlayers > 1:
+            data = _archive_data((times.size, nlayers, alats.size, alons.size), land, margin, rng, low, high)
+            dims = ('time', 'depth', 'lat', 'lon')
+        else:
+            data = _archive_data((times.size, alats.size, alons.size), land, margin, rng, low, high)
+            dims = ('time', 'lat', 'lon')
+        ds = xr.Dataset({var: (dims, data)}, coords={'time': times, 'lat': alats, 'lon': alons})
+        outdir = os.path.join(rose_data, 'etc', 'barra_r2', freq, var, 'latest')
+        os.makedirs(outdir, exist_ok=True)
+        ds.to_netcdf(os.path.join(outdir, f'{var}_AUS-11_ERA5_historical_hres_BOM_BARRA-R2_v1_{freq}_{yyyymm}-{yyyymm}.nc'))
+
+
+def write_um_file(fname, lats, lons, date, rng, levels=10):
+    """
+    Write a UM fields file holding the land/surface fields (soil moisture and temperature
+    on 4 levels, surface temperature) and 4 atmospheric fields on the given number of levels.
+    """
+    import mule
+
+    valid = datetime.strptime(date, "%Y%m%d%H%M")
+    spacing = float(lats[1] - lats[0])
+
+    ff = mule.FieldsFile()
+    ff.fixed_length_header = mule.FixedLengthHeader.empty()
+    flh = ff.fixed_length_header
+    flh.data_set_format_version = 20
+    flh.sub_model = 1
+    flh.vert_coord_type = 1
+    flh.horiz_grid_type = 3
+    flh.dataset_type = 3
+    flh.grid_staggering = 6
+    for prefix in ('t1', 't2', 't3'):
+        for name, value in (('year', valid.year), ('month', valid.month), ('day', valid.day),
+                            ('hour', valid.hour), ('minute', valid.minute), ('second', 0)):
+            setattr(flh, f'{prefix}_{name}', value)
+    ff.integer_constants = mule.ff.FF_IntegerConstants.empty()
+    ff.integer_constants.num_cols = lons.size
+    ff.integer_constants.num_rows = lats.size
+    ff.integer_constants.num_p_levels = levels
+    ff.integer_constants.num_wet_levels = levels
+    ff.integer_constants.num_soil_levels = 4
+    ff.real_constants = mule.ff.FF_RealConstants.empty()
+    ff.real_constants.col_spacing = spacing
+    ff.real_constants.row_spacing = spacing
+    ff.real_constants.start_lat = float(lats[0])
+    ff.real_constants.start_lon = float(lons[0])
+    ff.real_constants.north_pole_lat = 90.
+    ff.real_constants.north_pole_lon = 0.
+    ff.level_dependent_constants = mule.ff.FF_LevelDependentConstants.empty(levels + 1)
+
+    def add_field(lbuser4, lblev, low, high):
+        field = mule.Field3.empty()
+        field.lbyr, field.lbmon, field.lbdat = valid.year, valid.month, valid.day
+        field.lbhr, field.lbmin = valid.hour, valid.minute
+        field.lbyrd, field.lbmond, field.lbdatd = valid.year, valid.month, valid.day
+        field.lbhrd, field.lbmind = valid.hour, valid.minute
+        field.lbtim = 11
+        field.lbft = 0
+        field.lbcode = 1
+        field.lbhem = 3
+        field.lbrow = lats.size
+        field.lbnpt = lons.size
+        field.lbext = 0
+        field.lbpack = 0
+        field.lbrel = 3
+        field.lbvc = 129 if lblev == 9999 else 6
+        field.lblev = lblev
+        field.lbproc = 0
+        field.lbuser1 = 1
+        field.lbuser4 = lbuser4
+        field.lbuser7 = 1
+        field.bplat = 90.
+        field.bplon = 0.
+        field.bgor = 0.
+        field.bzy = float(lats[0]) - spacing
+        field.bdy = spacing
+        field.bzx = float(lons[0]) - spacing
+        field.bdx = spacing
+        field.bmdi = RMDI
+        field.bmks = 1.0
+        field.set_data_provider(mule.ArrayDataProvider(rng.uniform(low, high, (lats.size, lons.size))))
+        ff.fields.append(field)
+
+    add_field(24, 9999, 270., 310.)
+    for level in range(1, 5):
+        add_field(9, level, 5., 100.)
+    for level in range(1, 5):
+        add_field(20, level, 270., 310.)
+    for lbuser4 in ATMOS_STASH:
+        for level in range(1, levels + 1):
+            add_field(lbuser4, level, 0., 1.)
+
+    ff.validate = lambda *args, **kwargs: True
+    ff.to_file(fname)
+
+
+def generate(outdir, nlat=200, nlon=200, date='202202260000', levels=10, land_fraction=0.5, seed=0):
+    """
+    Function to write a complete set of synthetic input data.
+
+    Parameters
+    ----------
+    outdir : string
+        The directory to write to
+    nlat, nlon : int, optional
+        The size of the domain
+    date : string, optional
+        The date-time of the start dumps in "%Y%m%d%H%M" format
+    levels : int, optional
+        The number of levels of the atmospheric fields of the start dumps
+    land_fraction : float, optional
+        The fraction of land points of the domain
+    seed : int, optional
+        The seed of the random data
+
+    Returns
+    -------
+    dict
+        The paths to the mask ('mask'), the start dump ('file'), the high-resolution
+        start dump ('hres_ic') and the directory to use as $ROSE_DATA ('rose_data')
+    """
+    rng = np.random.default_rng(seed)
+    lats, lons = make_grid(nlat, nlon)
+    land = make_land(nlat, nlon, land_fraction, rng)
+    paths = {
+        'mask': os.path.join(outdir, 'mask.nc'),
+        'file': os.path.join(outdir, 'astart'),
+        'hres_ic': os.path.join(outdir, 'hres_ic'),
+        'rose_data': os.path.join(outdir, 'rose_data'),
+    }
+    os.makedirs(outdir, exist_ok=True)
+    write_mask(paths['mask'], lats, lons, land)
+    write_um_file(paths['file'], lats, lons, date, rng, levels)
+    write_um_file(paths['hres_ic'], lats, lons, date, rng, levels)
+    write_era5land_archive(paths['rose_data'], lats, lons, land, date, rng)
+    write_barra_archive(paths['rose_data'], lats, lons, land, date, rng)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('outdir')
+    parser.add_argument('--size', type=int, nargs=2, default=[200, 200], metavar=('NLAT', 'NLON'))
+    parser.add_argument('--levels', type=int, default=10, help='Number of levels of the atmospheric fields')
+    parser.add_argument('--date', default='202202260000', help='Date-time of the start dumps (YYYYmmddHHMM)')
+    parser.add_argument('--land-fraction', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = generate(args.outdir, *args.size, args.date, args.levels, args.land_fraction, args.seed)
+    for name, path in paths.items():
+        print(f'{name}: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks of the land/surface swaps on synthetic data, end to end and per phase.
+
+Usage:
+    pytest benchmarks [--synthetic-size <nlat> <nlon>] [--synthetic-levels <n>] [--benchmark-...]
+"""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+mule = pytest.importorskip("mule")
+
+from replace_landsurface import (  # noqa: E402
+    replace_landsurface_with_BARRA2R_IC as barra,
+    replace_landsurface_with_ERA5land_IC as era5land,
+    replace_landsurface_with_FF_IC as ff,
+)
+from replace_landsurface import cache, datasets, engine, mask  # noqa: E402
+from replace_landsurface.patch import write_fields  # noqa: E402
+from replace_landsurface.records import read_field_data  # noqa: E402
+
+IC_DATE = "20220226T0000Z"
+WANTED_DT = "202202260000"
+MASK_VAR = "land_binary_mask"
+ROUNDS = 3
+
+
+def clear_caches():
+    """ Forget what earlier rounds learnt in memory (bounding boxes, directory listings, land points)."""
+    cache._boxes.clear()
+    datasets.find_archive_files.cache_clear()
+    mask.land_points.cache_clear()
+
+
+def run(benchmark, function, *args, **kwargs):
+    return benchmark.pedantic(function, args=args, kwargs=kwargs, setup=clear_caches, rounds=ROUNDS)
+
+
+############################################
+## === End to end === ##
+############################################
+def test_swap_land_era5land(benchmark, synthetic_data, ic_file):
+    run(benchmark, era5land.swap_land_era5land, Path(synthetic_data['mask']), ic_file, IC_DATE)
+
+
+def test_swap_land_barra(benchmark, synthetic_data, ic_file):
+    run(benchmark, barra.swap_land_barra, Path(synthetic_data['mask']), ic_file, IC_DATE)
+
+
+def test_swap_land_barra_streaming(benchmark, synthetic_data, ic_file):
+    run(benchmark, barra.swap_land_barra, Path(synthetic_data['mask']), ic_file, IC_DATE, max_memory=2**20)
+
+
+def test_swap_land_era5land_domains(benchmark, synthetic_data, ic_file, tmp_path):
+    # Two domains over the same region, sharing the reads of the archive
+    second = tmp_path / "domain2" / ic_file.name
+    second.parent.mkdir()
+    shutil.copyfile(synthetic_data['file'], second.as_posix().replace('.tmp', ''))
+    domains = [(Path(synthetic_data['mask']), ic_file), (Path(synthetic_data['mask']), second)]
+    run(benchmark, era5land.swap_land_era5land_domains, domains, IC_DATE)
+
+
+def test_swap_land_ff(benchmark, synthetic_data, ic_file):
+    run(benchmark, ff.swap_land_ff, Path(synthetic_data['mask']), ic_file, Path(synthetic_data['hres_ic']), IC_DATE)
+
+
+############################################
+## === Per phase === ##
+############################################
+def plan_reads(module, synthetic_data):
+    """ The read plan of the synthetic start dump, and the bounding box of the domain on the archive grid."""
+    plan = engine.ReadPlan(module.ARCHIVE, mule.load_umfile(synthetic_data['file']).fields, WANTED_DT)
+    bounds = engine.bounding_box(next(iter(plan.reads)), synthetic_data['mask'], MASK_VAR, module.ARCHIVE)
+    return plan, bounds
+
+
+@pytest.mark.parametrize("module", [era5land, barra], ids=["era5land", "barra"])
+def test_plan(benchmark, synthetic_data, module):
+    fields = mule.load_umfile(synthetic_data['file']).fields
+    run(benchmark, engine.ReadPlan, module.ARCHIVE, fields, WANTED_DT)
+
+
+@pytest.mark.parametrize("module", [era5land, barra], ids=["era5land", "barra"])
+def test_bounding_box(benchmark, synthetic_data, module):
+    plan, _ = plan_reads(module, synthetic_data)
+    run(benchmark, engine.bounding_box, next(iter(plan.reads)), synthetic_data['mask'], MASK_VAR, module.ARCHIVE)
+
+
+@pytest.mark.parametrize("module", [era5land, barra], ids=["era5land", "barra"])
+def test_read(benchmark, synthetic_data, module):
+    plan, bounds = plan_reads(module, synthetic_data)
+    run(benchmark, engine.read_files, plan.reads, WANTED_DT, bounds, module.ARCHIVE)
+
+
+@pytest.mark.parametrize("module", [era5land, barra], ids=["era5land", "barra"])
+def test_merge(benchmark, synthetic_data, module):
+    plan, bounds = plan_reads(module, synthetic_data)
+    ff_in = synthetic_data['file']
+    file_data = engine.read_files(plan.reads, WANTED_DT, bounds, module.ARCHIVE)
+    fields = [(f, row) for f, row in zip(mule.load_umfile(ff_in).fields, plan.replacements) if row is not None]
+
+    def merge_all():
+        for f, row in fields:
+            engine.merge_field(read_field_data(f, ff_in), file_data[plan.files[row.key]][row.var, row.layer], row)
+
+    run(benchmark, merge_all)
+
+
+def test_ff_index(benchmark, synthetic_data):
+    source_fields = mule.load_umfile(synthetic_data['hres_ic']).fields
+    run(benchmark, ff.FieldIndex, source_fields)
+
+
+@pytest.mark.parametrize("patch", [False, True], ids=["passthrough", "patch"])
+def test_write_fields(benchmark, synthetic_data, ic_file, patch):
+    ff_in = synthetic_data['file']
+    mf_in = mule.load_umfile(ff_in)
+    replacements = [(f, read_field_data(f, ff_in)) for f in mf_in.fields if f.lbuser4 in ff.LAND_STASH]
+    replaced = {id(f) for f, _ in replacements}
+
+    def write():
+        mf_out = mf_in.copy()
+        for f in mf_in.fields:
+            mf_out.fields.append(f if id(f) not in replaced else
+                                 ff.ReplaceOperator()([f, read_field_data(f, ff_in)]))
+        write_fields(mf_in, mf_out, ff_in, ic_file.as_posix(), replacements, patch)
+
+    run(benchmark, write)
@@ -0,0 +1,3 @@
+# The benchmarks are not part of the test suite: they are only collected when asked for
+# explicitly (e.g. "pytest benchmarks"), including when pytest is given the repository path.
+collect_ignore = ["benchmarks"]
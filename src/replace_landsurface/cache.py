@@ -0,0 +1,287 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Persistent cache of the information that does not change between the cycles of a suite.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from replace_landsurface.grid import GridBox
+
+# Environment variable with the cache directory (the cache is disabled if unset or empty)
+CACHE_DIR_ENV = 'REPLACE_LANDSURFACE_CACHE_DIR'
+
+# Environment variable with the maximum size in MB of the regional subsets kept in the cache
+# (the subset cache is disabled if unset or 0)
+SUBSET_CACHE_SIZE_ENV = 'REPLACE_LANDSURFACE_SUBSET_CACHE_SIZE'
+
+
+def _file_signature(fname):
+    """
+    Identify a file by its real path, size and modification time (changes if the file is rewritten).
+    """
+    st = os.stat(fname)
+    return {'path': os.path.realpath(fname), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+# Bounding boxes already computed or loaded by this process
+_boxes = {}
+
+
+def _box_key(source_dir, grid, maskfname, var):
+    """
+    Key (and its digest) identifying the bounding box of a mask on the grid of a source archive.
+    """
+    key = {
+        'mask': _file_signature(maskfname),
+        'var': var,
+        'source': os.path.realpath(source_dir),
+        'grid': grid,
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return key, digest
+
+
+def _box_entry_path(cache_dir, digest):
+    return os.path.join(cache_dir, 'bounding_box', digest + '.json')
+
+
+def load_box(cache_dir, source_dir, grid, maskfname, var):
+    """
+    Function to get the bounding box of a mask from the cache.
+
+    Boxes are also kept in memory, so that a process handling several files computes each box once.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory. The on-disk cache is disabled if empty.
+    source_dir : string
+        The base directory of the source archive
+    grid : dict
+        Description of the source grid (see grid_definition), so that a regridded archive is not matched
+    maskfname : POSIX string
+        POSIX path to the mask defining the spatial extent
+    var : string
+        The name of the mask variable that defines the spatial extent
+
+    Returns
+    -------
+    GridBox or None
+        The cached grid indices, or None if they are not in the cache.
+    """
+    if not os.path.exists(maskfname):
+        return None
+    key, digest = _box_key(source_dir, grid, maskfname, var)
+    if digest in _boxes:
+        return _boxes[digest]
+    if not cache_dir:
+        return None
+    try:
+        with open(_box_entry_path(cache_dir, digest)) as f:
+            entry = json.load(f)
+        if entry['key'] != key:
+            return None
+        box = GridBox.from_dict(entry['box'])
+    except (OSError, ValueError, KeyError):
+        return None
+    _boxes[digest] = box
+    return box
+
+
+def save_box(cache_dir, source_dir, grid, maskfname, var, box):
+    """
+    Function to store the bounding box of a mask in the cache.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory. The box is only kept in memory if empty.
+    source_dir : string
+        The base directory of the source archive
+    grid : dict
+        Description of the source grid (see grid_definition)
+    maskfname : POSIX string
+        POSIX path to the mask defining the spatial extent
+    var : string
+        The name of the mask variable that defines the spatial extent
+    box : GridBox
+        The grid indices to store
+
+    Returns
+    -------
+    None.
+    """
+    key, digest = _box_key(source_dir, grid, maskfname, var)
+    _boxes[digest] = GridBox.from_dict(box.to_dict())
+    if not cache_dir:
+        return
+    entry_path = _box_entry_path(cache_dir, digest)
+    entry = {'key': key, 'box': box.to_dict()}
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    # Write to a temporary file first so that concurrent tasks never read a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, entry_path)
+
+
+def grid_definition(lons, lats):
+    """
+    Summarise the coordinates of a lat/lon grid (first value, step, last value and size of each axis).
+    """
+    def axis(coords):
+        step = float(coords[1] - coords[0]) if coords.size > 1 else 0.
+        return [float(coords[0]), step, float(coords[-1]), int(coords.size)]
+    return {'lon': axis(lons), 'lat': axis(lats)}
+
+
+def subset_cache_size():
+    """
+    Maximum size in bytes of the regional subsets kept in the cache (0 if disabled).
+    """
+    return int(float(os.environ.get(SUBSET_CACHE_SIZE_ENV, 0) or 0) * 2**20)
+
+
+def _subset_key(ncfname, var, box):
+    """
+    Key (and its digest) identifying the regional subset of a variable of an archive file.
+    """
+    key = {
+        'source': _file_signature(ncfname),
+        'var': var,
+        'box': box.to_dict(),
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return key, digest
+
+
+def _subset_entry_paths(cache_dir, digest):
+    base = os.path.join(cache_dir, 'subset', digest)
+    return base + '.json', base + '.npy'
+
+
+def load_subset(cache_dir, ncfname, var, box):
+    """
+    Function to get the regional subset of a variable of an archive file from the cache.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory
+    ncfname : string
+        The name of the archive file
+    var : string
+        The name of the variable
+    box : GridBox
+        The grid indices of the region
+
+    Returns
+    -------
+    tuple (1d numpy array, numpy array) or None
+        The times of the file (datetime64) and the data of the region for all
+        the times (mapped read-only from the cache), or None if not in the cache.
+    """
+    key, digest = _subset_key(ncfname, var, box)
+    json_path, npy_path = _subset_entry_paths(cache_dir, digest)
+    try:
+        with open(json_path) as f:
+            entry = json.load(f)
+        if entry['key'] != key:
+            return None
+        times = np.array(entry['times'], dtype='i8').view(entry['time_dtype'])
+        data = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    # Mark the entry as recently used
+    os.utime(json_path)
+    return times, data
+
+
+def save_subset(cache_dir, ncfname, var, box, times, data, max_bytes):
+    """
+    Function to store the regional subset of a variable of an archive file in the cache,
+    evicting the least recently used subsets beyond the maximum size of the cache.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory
+    ncfname : string
+        The name of the archive file
+    var : string
+        The name of the variable
+    box : GridBox
+        The grid indices of the region
+    times : 1d numpy array
+        The times of the file (datetime64)
+    data : numpy array
+        The data of the region for all the times
+    max_bytes : int
+        The maximum size in bytes of the subsets kept in the cache
+
+    Returns
+    -------
+    None.
+    """
+    key, digest = _subset_key(ncfname, var, box)
+    json_path, npy_path = _subset_entry_paths(cache_dir, digest)
+    subset_dir = os.path.dirname(json_path)
+    os.makedirs(subset_dir, exist_ok=True)
+    entry = {'key': key, 'times': times.view('i8').tolist(), 'time_dtype': str(times.dtype)}
+    # Write to temporary files first so that concurrent tasks never read a partial entry
+    # (the data is written before its description, which marks the entry as complete)
+    fd, tmp_path = tempfile.mkstemp(dir=subset_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp_path, npy_path)
+    fd, tmp_path = tempfile.mkstemp(dir=subset_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, json_path)
+    evict_subsets(cache_dir, max_bytes)
+
+
+def evict_subsets(cache_dir, max_bytes):
+    """
+    Function to remove the least recently used subsets until the cache fits in its maximum size.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory
+    max_bytes : int
+        The maximum size in bytes of the subsets kept in the cache
+
+    Returns
+    -------
+    None.
+    """
+    entries = []
+    for json_path in glob.glob(os.path.join(cache_dir, 'subset', '*.json')):
+        npy_path = json_path[:-len('.json')] + '.npy'
+        try:
+            size = os.path.getsize(json_path) + os.path.getsize(npy_path)
+            entries.append((os.path.getmtime(json_path), size, json_path, npy_path))
+        except OSError:
+            # Removed by another task
+            continue
+    total = sum(entry[1] for entry in entries)
+    for _, size, json_path, npy_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in (json_path, npy_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
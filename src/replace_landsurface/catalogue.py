@@ -0,0 +1,223 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Catalogue of the files of the high-resolution archives, mapping each variable and
+time range to a file, so that the files are found without listing the archive
+directories on every run.
+
+The catalogue is built once with the hres_catalogue command, and used when the
+REPLACE_LANDSURFACE_CATALOGUE environment variable gives its path.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from glob import glob
+
+import numpy as np
+
+# Environment variable with the path to the catalogue (not used if unset or empty)
+CATALOGUE_ENV = 'REPLACE_LANDSURFACE_CATALOGUE'
+
+# Name of the ERA5-land and BARRA2-R archives in the catalogue
+ERA5_LAND = 'era5_land'
+BARRA_R2 = 'barra_r2'
+
+
+def _file_times(ncfname):
+    """
+    Read the time axis of a NetCDF file, as datetime64[s] (None if the times cannot be decoded).
+    """
+    import xarray as xr
+
+    with xr.open_dataset(ncfname) as d:
+        times = d['time'].values
+    if not np.issubdtype(times.dtype, np.datetime64):
+        return None
+    return times.astype('datetime64[s]')
+
+
+def catalogue_entry(archive, var, ncfname, freq=None):
+    """
+    Function to describe the time axis of an archive file.
+
+    Parameters
+    ----------
+    archive : string
+        The name of the archive (ERA5_LAND or BARRA_R2)
+    var : string
+        The name of the variable
+    ncfname : string
+        The name of the file
+    freq : string, optional
+        The frequency of the data (e.g. "1hr")
+
+    Returns
+    -------
+    dict or None
+        The entry of the catalogue, or None if the times of the file cannot be decoded.
+        Regular time axes are described by their start, step (in seconds) and length,
+        others by the list of their times.
+    """
+    times = _file_times(ncfname)
+    if times is None or times.size == 0:
+        return None
+    entry = {'archive': archive, 'var': var, 'freq': freq, 'path': os.path.realpath(ncfname),
+             'start': str(times[0]), 'end': str(times[-1]), 'ntimes': int(times.size)}
+    steps = np.diff(times).astype('i8')
+    if times.size == 1 or (steps[0] > 0 and np.all(steps == steps[0])):
+        entry['step'] = int(steps[0]) if times.size > 1 else 0
+    else:
+        entry['times'] = [str(t) for t in times]
+    return entry
+
+
+def build_catalogue(era_dir=None, barra_dir=None):
+    """
+    Function to scan the archives and list the time axis of each file.
+
+    Parameters
+    ----------
+    era_dir : string, optional
+        Base directory of the ERA5-land archive (files in <era_dir>/<var>/<yyyy>)
+    barra_dir : string, optional
+        Base directory of the BARRA2-R archive (files in <barra_dir>/<freq>/<var>/latest)
+
+    Returns
+    -------
+    dict
+        The catalogue
+    """
+    entries = []
+    archives = {}
+    if era_dir:
+        archives[ERA5_LAND] = os.path.realpath(era_dir)
+        for ncfname in sorted(glob(os.path.join(era_dir, '*', '*', '*.nc'))):
+            var = ncfname.split(os.sep)[-3]
+            entries.append(catalogue_entry(ERA5_LAND, var, ncfname))
+    if barra_dir:
+        archives[BARRA_R2] = os.path.realpath(barra_dir)
+        for ncfname in sorted(glob(os.path.join(barra_dir, '*', '*', 'latest', '*.nc'))):
+            freq, var = ncfname.split(os.sep)[-4:-2]
+            entries.append(catalogue_entry(BARRA_R2, var, ncfname, freq))
+    return {'archives': archives, 'files': [entry for entry in entries if entry is not None]}
+
+
+def write_catalogue(catalogue, fname):
+    """
+    Write the catalogue to a JSON file (atomically, so that running tasks never read a partial file).
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(catalogue, f)
+    os.replace(tmp_path, fname)
+
+
+@lru_cache
+def _load_catalogue(fname, mtime_ns):
+    """
+    Read a catalogue and index its files by archive, variable and frequency (once per version of the file).
+    """
+    with open(fname) as f:
+        catalogue = json.load(f)
+    index = {}
+    for entry in catalogue['files']:
+        index.setdefault((entry['archive'], entry['var'], entry['freq']), []).append(entry)
+    return catalogue['archives'], index
+
+
+def _time_index(entry, wanted):
+    """
+    Index of a time along the time axis of a file of the catalogue (None if not in the file).
+    """
+    start = np.datetime64(entry['start'], 's')
+    if 'times' in entry:
+        matches = np.flatnonzero(np.array(entry['times'], dtype='datetime64[s]') == wanted)
+        return int(matches[0]) if matches.size else None
+    offset = int((wanted - start).astype('i8'))
+    if entry['step'] == 0:
+        return 0 if offset == 0 else None
+    if offset % entry['step'] or not 0 <= offset // entry['step'] < entry['ntimes']:
+        return None
+    return offset // entry['step']
+
+
+def lookup(archive, archive_dir, var, wanted_dt, freq=None, fname=None):
+    """
+    Function to find the archive file holding a variable at a date/time in the catalogue.
+
+    Parameters
+    ----------
+    archive : string
+        The name of the archive (ERA5_LAND or BARRA_R2)
+    archive_dir : string
+        Base directory of the archive (the catalogue is not used if built for another directory)
+    var : string
+        The name of the variable
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    freq : string, optional
+        The frequency of the data (e.g. "1hr")
+    fname : string, optional
+        The path to the catalogue. By default, given by the REPLACE_LANDSURFACE_CATALOGUE environment variable.
+
+    Returns
+    -------
+    tuple (string, int) or None
+        The name of the file and the index of the date/time along its time axis,
+        or None if there is no catalogue or the date/time is not in it.
+    """
+    fname = fname or os.environ.get(CATALOGUE_ENV, "")
+    if not fname:
+        return None
+    try:
+        archives, index = _load_catalogue(fname, os.stat(fname).st_mtime_ns)
+    except (OSError, ValueError, KeyError):
+        print(f'WARNING: Cannot read the catalogue {fname}', file=sys.stderr)
+        return None
+    if archives.get(archive) != os.path.realpath(archive_dir):
+        return None
+    wanted = np.datetime64(datetime.strptime(wanted_dt, "%Y%m%d%H%M"), 's')
+    for entry in index.get((archive, var, freq), []):
+        if np.datetime64(entry['start'], 's') <= wanted <= np.datetime64(entry['end'], 's'):
+            TM = _time_index(entry, wanted)
+            if TM is not None:
+                return entry['path'], TM
+    return None
+
+
+def main():
+    """
+    Build the catalogue of the ERA5-land and BARRA2-R archives.
+
+    Parameters
+    ----------
+    None.  The arguments are given via the command-line
+
+    Returns
+    -------
+    None.  The catalogue is written to a JSON file
+    """
+    rose_data = os.environ.get('ROSE_DATA', "")
+    parser = argparse.ArgumentParser(description="Build the catalogue of the high-resolution archives.")
+    parser.add_argument('--output', required=True, help='Path to the catalogue (JSON file)')
+    parser.add_argument('--era-dir', default=os.path.join(rose_data, 'etc', 'era5_land'),
+                        help='Base directory of the ERA5-land archive (default: $ROSE_DATA/etc/era5_land)')
+    parser.add_argument('--barra-dir', default=os.path.join(rose_data, 'etc', 'barra_r2'),
+                        help='Base directory of the BARRA2-R archive (default: $ROSE_DATA/etc/barra_r2)')
+    args = parser.parse_args()
+
+    catalogue = build_catalogue(args.era_dir, args.barra_dir)
+    write_catalogue(catalogue, args.output)
+    print(f"{len(catalogue['files'])} files catalogued in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
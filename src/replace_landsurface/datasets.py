@@ -0,0 +1,393 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Helpers to open the NetCDF files of the high-resolution archives.
+"""
+
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from replace_landsurface.cache import load_subset, save_subset
+
+
+def _open_dataset(ncfname, chunked=False):
+    """
+    Open a NetCDF file, exiting with an error message if it does not exist.
+
+    If chunked, the variables are opened as dask arrays chunked as on disk, so that
+    only the chunks intersecting a selection are read (in parallel by the threaded scheduler).
+    """
+    if Path(ncfname).exists():
+        return xr.open_dataset(ncfname, chunks={} if chunked else None)
+    print(f'ERROR: File {ncfname} not found', file=sys.stderr)
+    sys.exit(1)
+
+
+@lru_cache
+def find_archive_files(pattern):
+    """
+    List the archive files matching a glob pattern, listing each directory only once per process.
+    """
+    return tuple(glob(pattern))
+
+
+@lru_cache
+def _wanted_datetime64(wanted_dt):
+    """
+    Convert a date-time in "%Y%m%d%H%M" format to a numpy datetime64.
+    """
+    return np.datetime64(datetime.strptime(wanted_dt, "%Y%m%d%H%M"))
+
+
+def find_time_index(times, wanted_dt, ncfname=""):
+    """
+    Function to find the index of a date/time along the time axis of a file.
+
+    Parameters
+    ----------
+    times : xarray DataArray or numpy array
+        The time coordinate of the file
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    ncfname : string, optional
+        The name of the file, only used in the error message
+
+    Returns
+    -------
+    int
+        The index of the date/time along the time axis
+    """
+    values = getattr(times, 'values', times)
+    if np.issubdtype(values.dtype, np.datetime64):
+        # Compare the raw integer time values in the units of the file
+        unit = np.datetime_data(values.dtype)[0]
+        wanted = _wanted_datetime64(wanted_dt).astype(f'datetime64[{unit}]').view('i8')
+        raw = values.view('i8')
+        TM = int(np.searchsorted(raw, wanted))
+        if TM < raw.size and raw[TM] == wanted:
+            return TM
+        # The time axis might not be sorted
+        matches = np.flatnonzero(raw == wanted)
+    else:
+        # Times not decoded to datetime64 (e.g. non-standard calendars)
+        matches = np.flatnonzero(times.dt.strftime("%Y%m%d%H%M").data == wanted_dt)
+    if matches.size:
+        return int(matches[0])
+    print(f'ERROR: Time {wanted_dt} not found in file {ncfname}', file=sys.stderr)
+    sys.exit(1)
+
+
+def chunk_bytes(var, index):
+    """
+    Function to estimate the bytes read to select part of a variable, given its on-disk chunks.
+
+    Parameters
+    ----------
+    var : xarray DataArray
+        The variable (as opened from the file)
+    index : tuple of int or slice
+        The selection along the first dimensions of the variable (slices with a step of 1)
+
+    Returns
+    -------
+    tuple of int
+        The (uncompressed) bytes of the chunks intersecting the selection, and the bytes selected
+    """
+    chunks = var.encoding.get('chunksizes') or var.shape
+    index = tuple(index) + (slice(None),) * (var.ndim - len(index))
+    read = used = var.dtype.itemsize
+    for n, c, i in zip(var.shape, chunks, index):
+        start, stop = (i, i + 1) if isinstance(i, (int, np.integer)) else i.indices(n)[:2]
+        if stop <= start:
+            return 0, 0
+        used *= stop - start
+        # Extent of the chunks intersecting [start, stop)
+        read *= min((stop - 1) // c * c + c, n) - start // c * c
+    return read, used
+
+
+class DatasetCache():
+    """ Container class to hold the datasets opened during a single run."""
+    def __init__(self, chunked=False):
+        """
+        Initialization function for DatasetCache class
+
+        Parameters
+        ----------
+        chunked : bool, optional
+            If True, open the datasets with dask arrays chunked as on disk
+
+        Returns
+        -------
+        None.
+        """
+        self.chunked = chunked
+        self._datasets = {}
+        self._time_indices = {}
+        # Bytes of the chunks read and bytes used by the selections
+        self.bytes_read = 0
+        self.bytes_used = 0
+        # The cache can be shared by threads reading ahead of the field loop
+        self._lock = threading.RLock()
+
+    def open(self, ncfname):
+        """
+        Return the dataset for a NetCDF file, opening it only the first time it is requested.
+
+        Parameters
+        ----------
+        ncfname : string
+            The name of the file to open
+
+        Returns
+        -------
+        xarray Dataset
+            The (cached) dataset handle. It must not be closed by the caller.
+        """
+        key = os.path.abspath(ncfname)
+        with self._lock:
+            if key not in self._datasets:
+                self._datasets[key] = _open_dataset(ncfname, self.chunked)
+            return self._datasets[key]
+
+    def time_index(self, ncfname, wanted_dt):
+        """
+        Return the index of a date/time along the time axis of a NetCDF file, computed once per file.
+
+        Parameters
+        ----------
+        ncfname : string
+            The name of the file
+        wanted_dt : string
+            The date-time required in "%Y%m%d%H%M" format
+
+        Returns
+        -------
+        int
+            The index of the date/time along the time axis
+        """
+        key = (os.path.abspath(ncfname), wanted_dt)
+        with self._lock:
+            if key not in self._time_indices:
+                self._time_indices[key] = find_time_index(self.open(ncfname)['time'], wanted_dt, ncfname)
+            return self._time_indices[key]
+
+    def set_time_index(self, ncfname, wanted_dt, TM):
+        """
+        Record the index of a date/time along the time axis of a NetCDF file, when known beforehand (e.g. from a catalogue).
+        """
+        with self._lock:
+            self._time_indices[(os.path.abspath(ncfname), wanted_dt)] = TM
+
+    def known_time_index(self, ncfname, wanted_dt):
+        """
+        Return the index of a date/time along the time axis of a NetCDF file if already known (None otherwise).
+        """
+        with self._lock:
+            return self._time_indices.get((os.path.abspath(ncfname), wanted_dt))
+
+    def record_read(self, var, index):
+        """
+        Account for the bytes read to select part of a variable (see chunk_bytes).
+        """
+        read, used = chunk_bytes(var, index)
+        with self._lock:
+            self.bytes_read += read
+            self.bytes_used += used
+
+    def add_reads(self, bytes_read, bytes_used):
+        """
+        Account for the bytes read and used by another cache (e.g. in a worker process).
+        """
+        with self._lock:
+            self.bytes_read += bytes_read
+            self.bytes_used += bytes_used
+
+    def pop_reads(self):
+        """
+        Return the bytes read and used so far, and reset them (so that they are not reported on close).
+        """
+        with self._lock:
+            reads = (self.bytes_read, self.bytes_used)
+            self.bytes_read = self.bytes_used = 0
+            return reads
+
+    def close(self):
+        """
+        Close all the datasets held by the cache, reporting the bytes read from them.
+        """
+        if self.bytes_used:
+            print(f'Archive reads: {self.bytes_read/2**20:.1f} MiB of chunks read for '
+                  f'{self.bytes_used/2**20:.1f} MiB used ({self.bytes_used/max(self.bytes_read, 1):.0%})')
+        for d in self._datasets.values():
+            d.close()
+        self._datasets.clear()
+        self._time_indices.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def open_dataset(ncfname, datasets=None):
+    """
+    Context manager to access a NetCDF file, either through a DatasetCache or directly.
+
+    Parameters
+    ----------
+    ncfname : string
+        The name of the file to open
+    datasets : DatasetCache, optional
+        Cache holding the datasets for the current run. If None, the file is
+        opened and closed again on exit.
+
+    Returns
+    -------
+    xarray Dataset
+        The dataset for the file.
+    """
+    if datasets is not None:
+        yield datasets.open(ncfname)
+        return
+    d = _open_dataset(ncfname)
+    try:
+        yield d
+    finally:
+        d.close()
+
+
+@contextmanager
+def use_datasets(datasets=None, chunked=False):
+    """
+    Context manager providing the DatasetCache of a run.
+
+    Parameters
+    ----------
+    datasets : DatasetCache, optional
+        Cache shared with the caller, which remains responsible for closing it.
+        If None, a new cache is created and closed on exit.
+    chunked : bool, optional
+        If True, the new cache opens the datasets with dask arrays chunked as on disk
+
+    Returns
+    -------
+    DatasetCache
+    """
+    if datasets is not None:
+        yield datasets
+        return
+    with DatasetCache(chunked) as datasets:
+        yield datasets
+
+
+# Maximum number of archive files kept open across runs
+SHARED_DATASETS_MAX = 64
+
+# DatasetCache objects shared by the runs of a long-running process, by chunking (None if not shared)
+_shared_datasets = None
+
+
+@contextmanager
+def shared_datasets():
+    """
+    Context manager keeping the archive datasets open across the runs made within it
+    (see run_datasets). The datasets are closed on exit.
+    """
+    global _shared_datasets
+    _shared_datasets = {}
+    try:
+        yield
+    finally:
+        for datasets in _shared_datasets.values():
+            datasets.close()
+        _shared_datasets = None
+
+
+@contextmanager
+def run_datasets(chunked=False):
+    """
+    Context manager providing the DatasetCache of a command-line run.
+
+    Parameters
+    ----------
+    chunked : bool, optional
+        If True, open the datasets with dask arrays chunked as on disk
+
+    Returns
+    -------
+    DatasetCache
+        A new cache, closed on exit, or the cache shared across runs within shared_datasets
+        (closed only when it holds more than SHARED_DATASETS_MAX datasets).
+    """
+    if _shared_datasets is None:
+        with DatasetCache(chunked) as datasets:
+            yield datasets
+        return
+    datasets = _shared_datasets.setdefault(chunked, DatasetCache(chunked))
+    if len(datasets._datasets) > SHARED_DATASETS_MAX:
+        datasets.close()
+    yield datasets
+
+
+def read_cached_subset(ncfname, FIELDN, wanted_dt, box, cache_dir, max_bytes, datasets=None):
+    """
+    Function to get the data of a variable for a date/time over a region, through the subset cache.
+
+    The first time a file is used, the region is extracted for all the times of
+    the file (e.g. a whole month) and stored in the cache. Later calls read the
+    date/time needed from the cache only.
+
+    Parameters
+    ----------
+    ncfname : string
+        The name of the file to read
+    FIELDN : string
+        The name of the variable in the file to read
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    box : GridBox
+        The grid indices of the region (the time must be the first dimension of the variable)
+    cache_dir : string
+        The cache directory
+    max_bytes : int
+        The maximum size in bytes of the subsets kept in the cache
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run. If None, the file is opened and closed here.
+
+    Returns
+    -------
+    numpy array or None
+        The data for the date/time over the region (the longitude sections are joined if
+        the region wraps around the grid), or None if the times of the file cannot be cached.
+    """
+    entry = load_subset(cache_dir, ncfname, FIELDN, box)
+    if entry is None:
+        with open_dataset(ncfname, datasets) as d:
+            times = d['time'].values
+            if not np.issubdtype(times.dtype, np.datetime64):
+                return None
+            try:
+                var = d[FIELDN]
+            except KeyError:
+                print(f'ERROR: Variable {FIELDN} not found in file {ncfname}', file=sys.stderr)
+                sys.exit(1)
+            data = np.concatenate([var[..., box.lat_slice, lon_slice].values for lon_slice in box.lon_slices], axis=-1)
+        save_subset(cache_dir, ncfname, FIELDN, box, times, data, max_bytes)
+        entry = (times, data)
+    times, data = entry
+    return np.asarray(data[find_time_index(times, wanted_dt, ncfname)])
@@ -0,0 +1,47 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Parsing of the date/times given on the command line.
+"""
+
+from datetime import datetime
+
+# Formats of the date/times used by the suites (tried before the ISO 8601 formats), with the
+# length of their date/times (strptime also accepts single digit hours and minutes)
+START_FORMATS = (("%Y%m%d%H%M", 12), ("%Y%m%dT%H%MZ", 14), ("%Y%m%dT%H%M", 13), ("%Y%m%d", 8))
+
+
+def parse_start(value):
+    """
+    Function to parse a date/time given on the command line.
+
+    The formats of the suites and the ISO 8601 formats are parsed with the standard
+    library. Other formats fall back to pandas (only imported in that case).
+
+    Parameters
+    ----------
+    value : string
+        The date/time (e.g. "202202260000")
+
+    Returns
+    -------
+    datetime
+        The date/time
+    """
+    for fmt, length in START_FORMATS:
+        if len(value) != length:
+            continue
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    import pandas
+
+    return pandas.to_datetime(value).to_pydatetime()
@@ -0,0 +1,854 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Replacement of the land/surface fields of a UM file with the data of a
+high-resolution NetCDF archive (ERA5-land, BARRA2-R), driven by a table mapping
+the fields of the UM file to the variables of the archive.
+
+The reads are planned before any data is read: the files holding the variables
+are found once, and each file is read once (for all its variables) at the
+date/time of the UM file. Only the variables and soil layers replacing fields
+present in the UM file are read.
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
+from pathlib import Path
+
+import mule
+import numpy as np
+
+from replace_landsurface.cache import grid_definition, load_box, save_box
+from replace_landsurface.catalogue import lookup
+from replace_landsurface.datasets import (
+    DatasetCache,
+    find_archive_files,
+    find_time_index,
+    open_dataset,
+    read_cached_subset,
+    use_datasets,
+)
+from replace_landsurface.grid import GridBox, box_indices, union_box
+from replace_landsurface.mask import land_points, read_mask_extent
+from replace_landsurface.memory import tile_rows
+from replace_landsurface.merge import merge_data, merge_points
+from replace_landsurface.patch import write_fields
+from replace_landsurface.pipeline import FieldPipeline
+from replace_landsurface.profiling import span, traced
+from replace_landsurface.records import read_field_data
+
+# Name of the variable of the mask defining the spatial extent
+MASK_VAR = "land_binary_mask"
+
+
+class Replacement():
+    """ Container class to describe the archive variable replacing a UM field (a row of a mapping table)."""
+    def __init__(self, stash, level, var, freq=None, multiplier=None, layer=None):
+        """
+        Initialization function for Replacement class
+
+        Parameters
+        ----------
+        stash : int
+            The STASH code of the UM field (lbuser4)
+        level : int or None
+            The level of the UM field (lblev), or None for any level
+        var : string
+            The name of the variable in the archive
+        freq : string, optional
+            The frequency of the variable in the archive (e.g. "1hr"), if the archive is organised by frequency
+        multiplier : float, optional
+            Scaling of the archive data (no scaling if None)
+        layer : int, optional
+            Index of the layer of the archive data (along the dimension before the latitudes),
+            if the variable has several layers
+
+        Returns
+        -------
+        None.
+        """
+        self.stash = stash
+        self.level = level
+        self.var = var
+        self.freq = freq
+        self.multiplier = multiplier
+        self.layer = layer
+
+    @property
+    def key(self):
+        """ The variable and frequency, identifying the archive file to read."""
+        return (self.var, self.freq)
+
+    def __repr__(self):
+        return (f"{type(self).__name__}({self.stash}, {self.level}, {self.var!r}, freq={self.freq!r}, "
+                f"multiplier={self.multiplier}, layer={self.layer})")
+
+
+class Archive():
+    """ Container class to describe a high-resolution archive and the UM fields it replaces."""
+    def __init__(self, name, directory, pattern, table, lon='longitude', lat='latitude',
+                 lat_descending=False, signed_lons=False, cache_dir="", subset_cache_size=0):
+        """
+        Initialization function for Archive class
+
+        Parameters
+        ----------
+        name : string
+            The name of the archive in the catalogue (see replace_landsurface.catalogue)
+        directory : string
+            Base directory of the archive
+        pattern : string
+            Glob pattern of the files of the archive, relative to the base directory,
+            with {var}, {freq}, {yyyy} and {mm} in place of the variable, frequency, year and month
+        table : list of Replacement
+            The UM fields replaced and the variables replacing them
+        lon, lat : string, optional
+            The names of the longitude and latitude coordinates of the files
+        lat_descending : bool, optional
+            True if the latitudes of the files run north to south (the data is flipped to the UM order)
+        signed_lons : bool, optional
+            True if the longitudes of the files run from -180 to 180 (rather than 0 to 360)
+        cache_dir : string, optional
+            Directory to cache the domain bounding box across runs (disabled if empty)
+        subset_cache_size : int, optional
+            Maximum size in bytes of the regional subsets of the archive kept in the cache directory (disabled if 0)
+
+        Returns
+        -------
+        None.
+        """
+        self.name = name
+        self.directory = directory
+        self.pattern = pattern
+        self.table = list(table)
+        self.lon = lon
+        self.lat = lat
+        self.lat_descending = lat_descending
+        self.signed_lons = signed_lons
+        self.cache_dir = cache_dir
+        self.subset_cache_size = subset_cache_size
+        self._rows = {}
+        for row in self.table:
+            self._rows.setdefault((row.stash, row.level), row)
+
+    def replacement(self, f):
+        """
+        Return the row of the table replacing a UM field (None if the field is not replaced).
+        """
+        row = self._rows.get((f.lbuser4, f.lblev))
+        if row is None:
+            row = self._rows.get((f.lbuser4, None))
+        return row
+
+
+class ReplaceOperator(mule.DataOperator):
+    """ Mule operator for replacing the data"""
+    def __init__(self):
+        pass
+    def new_field(self, sources):
+        return sources[0]
+    def transform(self, sources, result):
+        return sources[1]
+
+
+class StreamReplaceOperator(mule.DataOperator):
+    """ Mule operator computing the data of a field when the field is written (the data is released once written)."""
+    def __init__(self):
+        pass
+    def new_field(self, sources):
+        return sources[0]
+    def transform(self, sources, result):
+        return sources[1]()
+
+
+class bounding_box(GridBox):
+    """ Container class to hold spatial extent information."""
+    def __init__(self, ncfname, maskfname, var, archive, datasets=None):
+        """
+        Initialization function for bounding_box class
+
+        Parameters
+        ----------
+        ncfname : POSIX string
+            POSIX path to input data (from the NetCDF archive)
+        maskfname : POSIX string
+            POSIX path to mask information to define the data to be cut out
+        var : string
+            The name of the mask variable that defines the spatial extent
+        archive : Archive
+            The archive of the input data
+        datasets : DatasetCache, optional
+            Cache of the datasets opened during the run
+
+        Returns
+        -------
+        None.  The variables describing the spatial extent are definied within bounding box object.
+
+        """
+
+        # Read in the grid from the high-res netcdf archive
+        with open_dataset(ncfname, datasets) as d:
+            lons = d[archive.lon].data
+            lats = d[archive.lat].data
+        grid = grid_definition(lons, lats)
+
+        # Skip reading the mask if the bounding box is already in the cache (for the same grid)
+        box = load_box(archive.cache_dir, archive.directory, grid, maskfname, var)
+        if box is not None:
+            super().__init__(**box.to_dict())
+            return
+
+        # Read in the mask and get the minimum/maximum latitude and longitude information
+        if not Path(maskfname).exists():
+            print(f'ERROR: File {maskfname} not found', file=sys.stderr)
+            sys.exit(1)
+        lonmin, lonmax, latmin, latmax = read_mask_extent(maskfname, var)
+        if archive.signed_lons and lonmax > 180.:
+            lonmax = lonmax-360.
+
+        # Work out which grid points define the minimum/maximum extents of the grid of interest
+        super().__init__(*box_indices(lons, lats, lonmin, lonmax, latmin, latmax))
+        save_box(archive.cache_dir, archive.directory, grid, maskfname, var, self)
+
+
+@traced('discover', 'var', 'freq')
+def find_file(archive, var, freq, wanted_dt, datasets=None):
+    """
+    Function to find the archive file holding a variable at a date/time.
+
+    The file is looked up in the catalogue of the archive if available, and found by
+    listing the archive directory (for the month) otherwise.
+
+    Parameters
+    ----------
+    archive : Archive
+        The archive
+    var : string
+        The name of the variable
+    freq : string or None
+        The frequency of the variable (e.g. "1hr")
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run, given the time index found in the catalogue
+
+    Returns
+    -------
+    string
+        The name of the file
+    """
+    found = lookup(archive.name, archive.directory, var, wanted_dt, freq)
+    if found is not None:
+        ncfname, TM = found
+        if datasets is not None:
+            datasets.set_time_index(ncfname, wanted_dt, TM)
+        return ncfname
+    pattern = archive.pattern.format(var=var, freq=freq, yyyy=wanted_dt[0:4], mm=wanted_dt[4:6])
+    files = find_archive_files(os.path.join(archive.directory, pattern))
+    if not files:
+        print(f'ERROR: No file matching {pattern} found in {archive.directory}', file=sys.stderr)
+        sys.exit(1)
+    return sorted(files)[0]
+
+
+class ReadPlan():
+    """ Container class to hold the archive reads replacing the fields of a UM file, grouped by file."""
+    def __init__(self, archive, fields, wanted_dt, datasets=None):
+        """
+        Initialization function for ReadPlan class
+
+        Only the variables (and layers) replacing fields present in the UM file are read.
+
+        Parameters
+        ----------
+        archive : Archive
+            The archive to read
+        fields : list of mule Field
+            The fields of the UM file
+        wanted_dt : string
+            The date-time required in "%Y%m%d%H%M" format
+        datasets : DatasetCache, optional
+            Cache of the datasets opened during the run
+
+        Returns
+        -------
+        None.
+        """
+        # The row of the table replacing each field (None if not replaced)
+        self.replacements = [archive.replacement(f) for f in fields]
+        # The layers of each variable needed by the fields (None for the variables without layers)
+        layers = {}
+        for row in self.replacements:
+            if row is not None:
+                layers.setdefault(row.key, set()).add(row.layer)
+        # The file holding each variable, and the variables (and their layers) to read from each file
+        self.files = {}
+        self.reads = {}
+        for key in sorted(layers, key=str):
+            ncfname = find_file(archive, *key, wanted_dt, datasets)
+            self.files[key] = ncfname
+            self.reads.setdefault(ncfname, {})[key[0]] = None if None in layers[key] else tuple(sorted(layers[key]))
+
+
+def layer_runs(layers):
+    """
+    Split sorted layer indices into runs of consecutive layers, returned as slices (each run is read at once).
+    """
+    runs = []
+    for layer in layers:
+        if runs and runs[-1].stop == layer:
+            runs[-1] = slice(runs[-1].start, layer+1)
+        else:
+            runs.append(slice(layer, layer+1))
+    return runs
+
+
+@traced('read', 'ncfname', 'FIELDNS')
+def read_file(ncfname, FIELDNS, wanted_dt, bounds, archive, datasets=None):
+    """
+    Function to get the data of several variables of an archive file, for a date/time and spatial extent.
+
+    Parameters
+    ----------
+    ncfname : string
+        The name of the file to read
+    FIELDNS : dict
+        The layers to read of each variable (None to read the variable whole, e.g. if it has no layers)
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    bounds : bounding_box object
+        A bounding box object defining the spatial extent to keep
+    archive : Archive
+        The archive of the file
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run. If None, the file is opened and closed here.
+
+    Returns
+    -------
+    dict
+        The numpy array for each variable and layer (the layer is None if the variable is read whole), south to north
+    """
+    data = {}
+    FIELDNS = dict(FIELDNS)
+
+    # Read the data from the regional subset cache if enabled
+    if archive.cache_dir and archive.subset_cache_size:
+        for FIELDN, layers in list(FIELDNS.items()):
+            subset = read_cached_subset(ncfname, FIELDN, wanted_dt, bounds, archive.cache_dir,
+                                        archive.subset_cache_size, datasets)
+            if subset is not None:
+                for layer in layers or (None,):
+                    data[FIELDN, layer] = subset if layer is None else subset[layer]
+                del FIELDNS[FIELDN]
+
+    if FIELDNS:
+        with open_dataset(ncfname, datasets) as d:
+
+            # Find the array index for the date/time of interest
+            if datasets is not None:
+                TM = datasets.time_index(ncfname, wanted_dt)
+            else:
+                TM = find_time_index(d['time'], wanted_dt, ncfname)
+
+            for FIELDN, layers in FIELDNS.items():
+                try:
+                    var = d[FIELDN]
+                except KeyError:
+                    print(f'ERROR: Variable {FIELDN} not found in file {ncfname}', file=sys.stderr)
+                    sys.exit(1)
+                # Only the layers needed (each run of consecutive layers at once)
+                runs = [()] if layers is None else [(run,) for run in layer_runs(layers)]
+                for run in runs:
+                    # The longitude sections (two if the extent wraps around the grid)
+                    sections = []
+                    for lon_slice in bounds.lon_slices:
+                        index = (TM,) + run + (bounds.lat_slice, lon_slice)
+                        sections.append(var[index].values)
+                        if datasets is not None:
+                            datasets.record_read(var, index)
+                    values = sections[0] if len(sections) == 1 else np.concatenate(sections, axis=-1)
+                    if layers is None:
+                        data[FIELDN, None] = values
+                    else:
+                        for layer in range(run[0].start, run[0].stop):
+                            data[FIELDN, layer] = values[layer - run[0].start]
+
+    # Flip the data vertically if the latitudes are reversed in direction to the UM FF (e.g. era5-land)
+    if archive.lat_descending:
+        data = {key: values[..., ::-1, :] for key, values in data.items()}
+    return data
+
+
+def read_workers(workers, nfiles):
+    """
+    Number of threads or processes reading some archive files in parallel
+    (by default, one per file up to the number of CPUs).
+    """
+    if workers is None:
+        return min(nfiles, os.cpu_count() or 1)
+    return workers
+
+
+def _read_file_process(ncfname, FIELDNS, wanted_dt, bounds, archive, chunked=False, TM=None):
+    """
+    Read an archive file in a worker process (see read_files), returning the data and the bytes read and used.
+    """
+    datasets = DatasetCache(chunked)
+    try:
+        if TM is not None:
+            datasets.set_time_index(ncfname, wanted_dt, TM)
+        data = read_file(ncfname, FIELDNS, wanted_dt, bounds, archive, datasets)
+        return data, datasets.pop_reads()
+    finally:
+        datasets.close()
+
+
+def read_files(reads, wanted_dt, bounds, archive, datasets=None, workers=None):
+    """
+    Function to get the data of the variables of several archive files.
+
+    Parameters
+    ----------
+    reads : dict
+        The variables (and their layers) to read from each file (see read_file)
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    bounds : bounding_box object
+        A bounding box object defining the spatial extent to keep
+    archive : Archive
+        The archive of the files
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run
+    workers : int, optional
+        Number of processes reading the files in parallel (serial reads if 1).
+        By default, the files are read by threads sharing the datasets of the run,
+        one per file up to the number of CPUs.
+
+    Returns
+    -------
+    dict
+        The data read from each file (see read_file)
+    """
+    ncfnames = list(reads)
+    FIELDNS = [reads[ncfname] for ncfname in ncfnames]
+    if workers is not None and workers > 1 and len(ncfnames) > 1:
+        # Read the files in separate processes, each opening the files it reads.
+        # The forkserver context avoids forking a process that holds open HDF5 files.
+        chunked = datasets is not None and datasets.chunked
+        TMS = [datasets.known_time_index(ncfname, wanted_dt) if datasets is not None else None for ncfname in ncfnames]
+        with ProcessPoolExecutor(max_workers=min(workers, len(ncfnames)),
+                                 mp_context=multiprocessing.get_context('forkserver')) as pool:
+            results = list(pool.map(_read_file_process, ncfnames, FIELDNS, repeat(wanted_dt), repeat(bounds),
+                                    repeat(archive), repeat(chunked), TMS))
+        data = [values for values, _ in results]
+        if datasets is not None:
+            for _, (bytes_read, bytes_used) in results:
+                datasets.add_reads(bytes_read, bytes_used)
+    elif workers is None and len(ncfnames) > 1:
+        # Read the files in threads, through the datasets of the run
+        with ThreadPoolExecutor(max_workers=read_workers(workers, len(ncfnames))) as pool:
+            data = list(pool.map(read_file, ncfnames, FIELDNS, repeat(wanted_dt), repeat(bounds),
+                                 repeat(archive), repeat(datasets)))
+    else:
+        data = [read_file(ncfname, FIELDN, wanted_dt, bounds, archive, datasets) for ncfname, FIELDN in zip(ncfnames, FIELDNS)]
+    return dict(zip(ncfnames, data))
+
+
+def merge_field(current_data, data, replacement, points=None):
+    """
+    Merge the (scaled) archive data of a replacement into the current data of a field,
+    keeping the current data where the archive data is missing (and away from the land points if given).
+    """
+    if points is not None:
+        return merge_points(current_data, data, points, replacement.multiplier)
+    return merge_data(current_data, data, replacement.multiplier)
+
+
+def _merge_file_data(current_data, file_data, replacement, points=None):
+    """ Merge the data of the variable (and layer) of a replacement, from the data read from its file."""
+    return merge_field(current_data, file_data[replacement.var, replacement.layer], replacement, points)
+
+
+@traced('read', 'ncfname', 'FIELDN', 'layer', 'start')
+def read_tile(ncfname, FIELDN, layer, wanted_dt, bounds, archive, start, stop, datasets=None):
+    """
+    Function to get the data of a layer of a variable of an archive file, for a date/time and some rows of the spatial extent.
+
+    Parameters
+    ----------
+    ncfname : string
+        The name of the file to read
+    FIELDN : string
+        The name of the variable
+    layer : int or None
+        The layer to read (None if the variable has no layers)
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    bounds : bounding_box object
+        A bounding box object defining the spatial extent to keep
+    archive : Archive
+        The archive of the file
+    start, stop : int
+        The rows of the spatial extent to read (numbered south to north, stop excluded)
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run. If None, the file is opened and closed here.
+
+    Returns
+    -------
+    2d numpy array
+        The data of the rows, south to north
+    """
+    # The rows in the order of the file
+    if archive.lat_descending:
+        lat_slice = slice(bounds.latmax+1-stop, bounds.latmax+1-start)
+    else:
+        lat_slice = slice(bounds.latmin+start, bounds.latmin+stop)
+    layers = () if layer is None else (layer,)
+
+    with open_dataset(ncfname, datasets) as d:
+
+        # Find the array index for the date/time of interest
+        if datasets is not None:
+            TM = datasets.time_index(ncfname, wanted_dt)
+        else:
+            TM = find_time_index(d['time'], wanted_dt, ncfname)
+
+        try:
+            var = d[FIELDN]
+        except KeyError:
+            print(f'ERROR: Variable {FIELDN} not found in file {ncfname}', file=sys.stderr)
+            sys.exit(1)
+        # The longitude sections (two if the extent wraps around the grid)
+        sections = []
+        for lon_slice in bounds.lon_slices:
+            index = (TM,) + layers + (lat_slice, lon_slice)
+            sections.append(var[index].values)
+            if datasets is not None:
+                datasets.record_read(var, index)
+    data = sections[0] if len(sections) == 1 else np.concatenate(sections, axis=-1)
+
+    # Flip the data vertically if the latitudes are reversed in direction to the UM FF (e.g. era5-land)
+    if archive.lat_descending:
+        data = data[::-1, :]
+    return data
+
+
+def stream_field(f, ff_in, ncfname, replacement, wanted_dt, bounds, archive, max_memory, datasets=None, points=None):
+    """
+    Function to merge the archive data into a field, reading the archive data by tiles of rows within a memory budget.
+
+    Parameters
+    ----------
+    f : mule Field
+        The field to replace
+    ff_in : POSIX string
+        POSIX path to the input UM file
+    ncfname : string
+        The name of the archive file holding the variable of the replacement
+    replacement : Replacement
+        The row of the table replacing the field
+    wanted_dt : string
+        The date-time required in "%Y%m%d%H%M" format
+    bounds : bounding_box object
+        A bounding box object defining the spatial extent to keep
+    archive : Archive
+        The archive of the file
+    max_memory : int
+        The memory budget in bytes for the archive data read at once
+        (the whole layer if it fits, tiles of rows otherwise)
+    datasets : DatasetCache, optional
+        Cache of the datasets opened during the run
+    points : LandPoints, optional
+        The land points of the mask (the archive data is merged at the land points only if given)
+
+    Returns
+    -------
+    2d numpy array
+        The merged data
+    """
+    with span('merge', stash=f.lbuser4, level=f.lblev):
+        current_data = read_field_data(f, ff_in)
+        nrows, ncols = current_data.shape
+        # Budget for the rows read, as double precision after scaling
+        rows = tile_rows(nrows, ncols * 8, max_memory)
+        out = None
+        for start in range(0, nrows, rows):
+            stop = min(start + rows, nrows)
+            data = read_tile(ncfname, replacement.var, replacement.layer, wanted_dt, bounds, archive, start, stop, datasets)
+            if out is None:
+                out = np.empty(current_data.shape, dtype=np.result_type(current_data, data).newbyteorder('='))
+            if points is not None:
+                merge_points(current_data[start:stop], data, points.tile(start, stop), replacement.multiplier, out=out[start:stop])
+            else:
+                merge_data(current_data[start:stop], data, replacement.multiplier, out=out[start:stop])
+            del data
+    return out
+
+
+def swap_land(archive, mask_fullpath, ic_file_fullpath, ic_date, datasets=None, workers=None, pipeline=False, patch=False, land_only=False, max_memory=None):
+    """
+    Function to replace the land/surface fields of a UM file with the data of an archive.
+
+    Parameters
+    ----------
+    archive : Archive
+        The archive, and the fields it replaces
+    mask_fullpath : Path
+        Path to the mask defining the spatial extent
+    ic_file_fullpath : Path
+        Path to file with the coarser resolution data to be replaced with ".tmp" appended at end
+    ic_date : string
+        The date-time required in "%Y%m%dT%H%MZ" format
+    datasets : DatasetCache, optional
+        Cache of the archive datasets shared across several calls (e.g. in batch mode).
+        If None, the datasets are opened and closed within this call.
+    workers : int, optional
+        Number of processes reading the archive files in parallel (threads in pipelined mode).
+        By default, threads sharing the open archive files, one per file up to the number of CPUs.
+    pipeline : bool, optional
+        If True, overlap the reads of the archive data with the merges and the writing of the output file
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input file when they fit
+        (not used in pipelined mode)
+    land_only : bool, optional
+        If True, only merge the archive data at the land points of the mask
+    max_memory : int, optional
+        If given, stream the fields: each field is read, merged and written in turn, and released once written.
+        The archive data is read by layer, or by tiles of rows when a layer does not fit in this budget (in bytes).
+        The reads are not parallel or pipelined, and the output file is written by mule (not patched).
+
+    Returns
+    -------
+    None.
+        The file is replaced with a version of itself holding the higher-resolution data.
+    """
+    ic_z_date = ic_date.replace('T', '').replace('Z', '')
+
+    # Path to input file
+    ff_in = ic_file_fullpath.as_posix().replace('.tmp', '')
+
+    # Path to output file
+    ff_out = ic_file_fullpath.as_posix()
+
+    # Read input file
+    with span('load', file=ff_in):
+        mf_in = mule.load_umfile(ff_in)
+
+    # Open each archive file only once (closed once all the variables are read)
+    with use_datasets(datasets) as datasets:
+
+        # Work out which variable (if any) replaces each field, and find the files to read
+        plan = ReadPlan(archive, mf_in.fields, ic_z_date, datasets)
+        if not plan.reads:
+            print(f'No fields to replace in {ff_in}')
+            merge_fields(mf_in, ff_in, ff_out, plan, {}, patch=patch)
+            return
+
+        # Define spatial extent of grid required (all the files of the archive share the same grid)
+        with span('bounding_box'):
+            bounds = bounding_box(next(iter(plan.reads)), mask_fullpath.as_posix(), MASK_VAR, archive, datasets)
+
+        # Land points of the domain (read once per run)
+        points = land_points(mask_fullpath.as_posix(), MASK_VAR) if land_only else None
+
+        if max_memory:
+            # Compute the data of each replaced field only when mule writes it
+            stream = StreamReplaceOperator()
+            mf_out = mf_in.copy()
+            for f, row in zip(mf_in.fields, plan.replacements):
+                if row is None:
+                    mf_out.fields.append(f)
+                    continue
+                compute = partial(stream_field, f, ff_in, plan.files[row.key], row, ic_z_date, bounds, archive,
+                                  max_memory, datasets, points)
+                mf_out.fields.append(stream([f, compute]))
+            write_fields(mf_in, mf_out, ff_in, ff_out, None)
+            return
+
+        if pipeline:
+            # Read each file ahead of the field loop while earlier fields are merged and written
+            fp = FieldPipeline(ff_in, read_workers(workers, len(plan.reads)))
+            file_reads = {ncfname: fp.read(read_file, ncfname, FIELDNS, ic_z_date, bounds, archive, datasets)
+                          for ncfname, FIELDNS in plan.reads.items()}
+            mf_out = mf_in.copy()
+            for index, (f, row) in enumerate(zip(mf_in.fields, plan.replacements)):
+                if row is None:
+                    mf_out.fields.append(f)
+                    continue
+                merge = partial(_merge_file_data, replacement=row, points=points)
+                mf_out.fields.append(fp.replace(f, index, file_reads[plan.files[row.key]], merge))
+            fp.write(mf_out, ff_out)
+            return
+
+        # Read all the required files before processing the fields
+        file_data = read_files(plan.reads, ic_z_date, bounds, archive, datasets, workers)
+
+    # Merge the data into the fields and write the output file
+    merge_fields(mf_in, ff_in, ff_out, plan, file_data, points, patch)
+
+
+def merge_fields(mf_in, ff_in, ff_out, plan, file_data, points=None, patch=False):
+    """
+    Function to merge the archive data into the fields of a UM file, and write the output file.
+
+    Parameters
+    ----------
+    mf_in : mule UMFile
+        The input file
+    ff_in : POSIX string
+        POSIX path to the input file
+    ff_out : POSIX string
+        POSIX path to the output file
+    plan : ReadPlan
+        The read plan of the file
+    file_data : dict
+        The data read from each archive file, over the spatial extent of the file (see read_files)
+    points : LandPoints, optional
+        The land points of the mask (the archive data is merged at the land points only if given)
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input file when they fit
+
+    Returns
+    -------
+    None.
+    """
+    # Create Mule Replacement Operator
+    replace = ReplaceOperator()
+
+    # Set up the output file
+    mf_out = mf_in.copy()
+    replacements = []
+
+    # For each field in the input write to the output file (but modify as required)
+    for f, row in zip(mf_in.fields, plan.replacements):
+        if row is None:
+            mf_out.fields.append(f)
+            continue
+        # replace coarse soil moisture/temperature and surface temperature with high-res information
+        with span('merge', stash=f.lbuser4, level=f.lblev):
+            data = _merge_file_data(read_field_data(f, ff_in), file_data[plan.files[row.key]], row, points)
+        mf_out.fields.append(replace([f, data]))
+        replacements.append((f, data))
+
+    # Write output file
+    write_fields(mf_in, mf_out, ff_in, ff_out, replacements, patch)
+
+
+def slice_box(data, box, union, archive):
+    """
+    Slice the data read over the union of the spatial extents of several domains, to the extent of one domain.
+
+    Parameters
+    ----------
+    data : numpy array
+        The data over the union (south to north, the last two dimensions being the latitudes and longitudes)
+    box : GridBox
+        The spatial extent of the domain
+    union : GridBox
+        The union of the spatial extents (see union_box)
+    archive : Archive
+        The archive of the data
+
+    Returns
+    -------
+    numpy array
+        A view of the data over the spatial extent of the domain
+    """
+    # The rows of the data run south to north, so from the last latitude of the file if the latitudes are descending
+    if archive.lat_descending:
+        row = union.latmax - box.latmax
+    else:
+        row = box.latmin - union.latmin
+    col = box.lonmin - union.lonmin
+    return data[..., row:row + box.latmax - box.latmin + 1, col:col + box.lonmax - box.lonmin + 1]
+
+
+def swap_land_domains(archive, domains, ic_date, datasets=None, workers=None, patch=False, land_only=False):
+    """
+    Function to replace the land/surface fields of the UM files of several domains with the data of an archive,
+    reading the archive once over the union of their spatial extents.
+
+    Parameters
+    ----------
+    archive : Archive
+        The archive, and the fields it replaces
+    domains : list of (Path, Path)
+        The path to the mask defining the spatial extent of each domain, and the path to its file
+        with the coarser resolution data to be replaced (with ".tmp" appended at end)
+    ic_date : string
+        The date-time required in "%Y%m%dT%H%MZ" format (the same for all the domains)
+    datasets : DatasetCache, optional
+        Cache of the archive datasets shared across several calls.
+        If None, the datasets are opened and closed within this call.
+    workers : int, optional
+        Number of processes reading the archive files in parallel.
+        By default, threads sharing the open archive files, one per file up to the number of CPUs.
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input files when they fit
+    land_only : bool, optional
+        If True, only merge the archive data at the land points of the masks
+
+    Returns
+    -------
+    None.
+        The files are replaced with versions of themselves holding the higher-resolution data.
+    """
+    ic_z_date = ic_date.replace('T', '').replace('Z', '')
+
+    # Paths to the input and output files
+    ff_ins = [ic_file_fullpath.as_posix().replace('.tmp', '') for _, ic_file_fullpath in domains]
+    ff_outs = [ic_file_fullpath.as_posix() for _, ic_file_fullpath in domains]
+    masks = [mask_fullpath.as_posix() for mask_fullpath, _ in domains]
+
+    # Read input files
+    mf_ins = []
+    for ff_in in ff_ins:
+        with span('load', file=ff_in):
+            mf_ins.append(mule.load_umfile(ff_in))
+
+    # Open each archive file only once (closed once all the variables are read)
+    with use_datasets(datasets) as datasets:
+
+        # Work out the reads of each domain, and the variables (and layers) of each file needed by any domain
+        plans = [ReadPlan(archive, mf_in.fields, ic_z_date, datasets) for mf_in in mf_ins]
+        reads = {}
+        for plan in plans:
+            for ncfname, FIELDNS in plan.reads.items():
+                union_reads = reads.setdefault(ncfname, {})
+                for FIELDN, layers in FIELDNS.items():
+                    if layers is None or union_reads.get(FIELDN, ()) is None:
+                        union_reads[FIELDN] = None
+                    else:
+                        union_reads[FIELDN] = tuple(sorted(set(layers) | set(union_reads.get(FIELDN, ()))))
+        if not reads:
+            for mf_in, ff_in, ff_out, plan in zip(mf_ins, ff_ins, ff_outs, plans):
+                print(f'No fields to replace in {ff_in}')
+                merge_fields(mf_in, ff_in, ff_out, plan, {}, patch=patch)
+            return
+
+        # Define spatial extent of grid required for each domain, and their union
+        with span('bounding_box'):
+            boxes = [bounding_box(next(iter(reads)), maskfname, MASK_VAR, archive, datasets) for maskfname in masks]
+            union = union_box(boxes)
+
+        if union is None:
+            # An extent wraps around the grid: read the archive for each domain
+            print('WARNING: Domain extents wrapping around the archive grid, reading the archive for each domain', file=sys.stderr)
+            all_data = [read_files(plan.reads, ic_z_date, box, archive, datasets, workers) for plan, box in zip(plans, boxes)]
+        else:
+            # Read all the required files once, over the union of the extents
+            union_data = read_files(reads, ic_z_date, union, archive, datasets, workers)
+            all_data = [{ncfname: {key: slice_box(values, box, union, archive) for key, values in file_data.items()}
+                         for ncfname, file_data in union_data.items()} for box in boxes]
+
+    # Merge the data into the fields of each domain and write its output file
+    for mf_in, ff_in, ff_out, plan, file_data, maskfname in zip(mf_ins, ff_ins, ff_outs, plans, all_data, masks):
+        points = land_points(maskfname, MASK_VAR) if land_only else None
+        merge_fields(mf_in, ff_in, ff_out, plan, file_data, points, patch)
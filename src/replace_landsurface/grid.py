@@ -0,0 +1,136 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Helpers to locate the spatial extent of a domain on the grid of the high-resolution archives.
+"""
+
+import numpy as np
+
+
+def coord_index(coords, value):
+    """
+    Function to find the index of the grid point closest to a coordinate value.
+
+    The index is computed arithmetically for regularly spaced coordinates, with
+    a searchsorted fallback for irregular grids.
+
+    Parameters
+    ----------
+    coords : 1d numpy array
+        The (monotonic) coordinate values of the grid
+    value : float
+        The coordinate value to look for
+
+    Returns
+    -------
+    int
+        The index of the grid point within half a grid spacing of the value
+    """
+    n = coords.size
+    # Coping with numerical inaccuracy
+    tol = abs(coords[1] - coords[0])/2.
+
+    # Regular grid: the index follows from the first point and the spacing
+    step = (coords[-1] - coords[0])/(n - 1)
+    index = int(round((value - coords[0])/step))
+    if 0 <= index < n and abs(coords[index] - value) < tol:
+        return index
+
+    # Irregular grid: search the (ascending) coordinates
+    ascending = coords[-1] > coords[0]
+    sorted_coords = coords if ascending else coords[::-1]
+    i = int(np.searchsorted(sorted_coords, value))
+    for index in (i - 1, i):
+        if 0 <= index < n and abs(sorted_coords[index] - value) < tol:
+            return index if ascending else n - 1 - index
+    raise ValueError(f"Coordinate value {value} not found on the source grid "
+                     f"(range {coords.min()} to {coords.max()}).")
+
+
+def box_indices(lons, lats, lonmin, lonmax, latmin, latmax):
+    """
+    Function to find the grid indices of the extent of a domain on the source grid.
+
+    Each axis uses its own tolerance of half a grid spacing.
+
+    Parameters
+    ----------
+    lons : 1d numpy array
+        Longitudes of the source grid
+    lats : 1d numpy array
+        Latitudes of the source grid
+    lonmin, lonmax, latmin, latmax : float
+        The extent of the domain
+
+    Returns
+    -------
+    tuple of int
+        The lonmin, lonmax, latmin and latmax indices on the source grid
+    """
+    latmin_index = coord_index(lats, latmin)
+    latmax_index = coord_index(lats, latmax)
+    # Swap the latitude min/max if upside down (is upside down for era5-land)
+    if latmax_index < latmin_index:
+        latmin_index, latmax_index = latmax_index, latmin_index
+    return coord_index(lons, lonmin), coord_index(lons, lonmax), latmin_index, latmax_index
+
+
+class GridBox():
+    """ Container class to hold the grid indices of a spatial extent (serializable with to_dict/from_dict)."""
+    def __init__(self, lonmin, lonmax, latmin, latmax):
+        self.lonmin = int(lonmin)
+        self.lonmax = int(lonmax)
+        self.latmin = int(latmin)
+        self.latmax = int(latmax)
+
+    @property
+    def wraps(self):
+        """ True if the extent wraps around the longitude range of the source grid."""
+        return self.lonmax < self.lonmin
+
+    @property
+    def lat_slice(self):
+        return slice(self.latmin, self.latmax+1)
+
+    @property
+    def lon_slices(self):
+        """ The longitude slices to read (two if the extent wraps around the grid)."""
+        if self.wraps:
+            return (slice(self.lonmin, None), slice(0, self.lonmax+1))
+        return (slice(self.lonmin, self.lonmax+1),)
+
+    def to_dict(self):
+        return {'lonmin': self.lonmin, 'lonmax': self.lonmax, 'latmin': self.latmin, 'latmax': self.latmax}
+
+    @staticmethod
+    def from_dict(d):
+        return GridBox(d['lonmin'], d['lonmax'], d['latmin'], d['latmax'])
+
+    def __eq__(self, other):
+        return isinstance(other, GridBox) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+def union_box(boxes):
+    """
+    Function to find the smallest extent holding the extents of several domains on the same source grid.
+
+    Parameters
+    ----------
+    boxes : list of GridBox
+        The extents of the domains
+
+    Returns
+    -------
+    GridBox or None
+        The union of the extents, or None if an extent wraps around the longitude range of the grid
+    """
+    if any(box.wraps for box in boxes):
+        return None
+    return GridBox(min(box.lonmin for box in boxes), max(box.lonmax for box in boxes),
+                   min(box.latmin for box in boxes), max(box.latmax for box in boxes))
@@ -12,17 +12,51 @@ era5-land or BARRA2-R data (if requested).
 
 import argparse
 import shutil
+import sys
+import time
+from contextlib import nullcontext
 from pathlib import Path
 
-import pandas
+from replace_landsurface.dates import parse_start
+from replace_landsurface.memory import parse_size, peak_rss
+from replace_landsurface.profiling import profile, span
+from replace_landsurface.server import submit
 
-from replace_landsurface import replace_landsurface_with_BARRA2R_IC, replace_landsurface_with_ERA5land_IC
+# The backends (and their dependencies) are only imported when selected by --type
+
+def read_manifest(manifest):
+    """
+    Read the list of ec_cb files and valid times to process from a manifest file.
+
+    Parameters
+    ----------
+    manifest : Path
+        Text file with one "<file> <start>" pair per line (blank lines and lines starting with "#" are ignored)
+
+    Returns
+    -------
+    list of (Path, datetime)
+        The files and valid times to process
+    """
+    jobs = []
+    with open(manifest) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            file, start = line.split()
+            jobs.append((Path(file), parse_start(start)))
+    return jobs
 
 def main():
     """
     The main function that creates a worker pool and generates single GRIB files 
     for requested date/times in parallel.
 
+    Several ec_cb files can be processed by a single call, either by giving
+    matching lists to --file and --start or through a --manifest file. The mask,
+    bounding box and archive datasets are then set up once and shared by all files.
+
     Parameters
     ----------
     None.  The arguments are given via the command-line
@@ -32,32 +66,75 @@ def main():
     None.  The ec_cb000 file is updated and overwritten
     """
 
+    # Run the job on the server if one is configured (see replace_landsurface.server)
+    status = submit('hres_eccb', sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
     # Parse the command-line arguments
+    args_start = time.perf_counter()
     parser = argparse.ArgumentParser()
     parser.add_argument('--mask', required=True, type=Path)
-    parser.add_argument('--file', required=True, type=Path)
-    parser.add_argument('--start', required=True, type=pandas.to_datetime)
+    parser.add_argument('--file', type=Path, nargs='+', default=[])
+    parser.add_argument('--start', type=parse_start, nargs='+', default=[])
+    parser.add_argument('--manifest', type=Path, help='File with one "<file> <start>" pair per line')
     parser.add_argument('--type', default="era5land")
     parser.add_argument('--hres_ic', type=Path)
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes reading the archive files in parallel (threads sharing the open archive files, one per file up to the number of CPUs, by default; threads reading the source data with --pipeline)')
+    parser.add_argument('--pipeline', action='store_true', help='Overlap the reads of the source data with the merges and the writing of the output file')
+    parser.add_argument('--chunked', action='store_true', help='Read the archive files by chunks (as laid out on disk) with dask')
+    parser.add_argument('--land-only', action='store_true', help='Only replace the land points of the mask (ERA5-land and BARRA2-R)')
+    parser.add_argument('--patch', action='store_true', help='Rewrite the replaced records in place in a copy of the input file when they fit (the unchanged records are copied otherwise)')
+    parser.add_argument('--max-memory', type=parse_size, help='Stream the fields one at a time, reading the source data by level (or by tiles of rows) within this budget (e.g. 512M, 2G; ERA5-land and BARRA2-R)')
+    parser.add_argument('--profile', type=Path, help='Append timing spans of the phases of the run to this file (JSON lines)')
+    parser.add_argument('--cprofile', type=Path, help='Write cProfile statistics of the run to this file (with --profile)')
     args = parser.parse_args()
     print(args)
 
-    # Convert the date/time to a formatted string
-    t = args.start.strftime("%Y%m%dT%H%MZ")
-    print(args.mask, args.file, t)
-
-    # If necessary replace ERA5 land/surface fields with higher-resolution options
-    if "era5land" in args.type:
-        replace_landsurface_with_ERA5land_IC.swap_land_era5land(args.mask, args.file, t)
-        shutil.move(args.file.as_posix(), args.file.as_posix().replace('.tmp', ''))
-    elif "barra" in args.type:
-        replace_landsurface_with_BARRA2R_IC.swap_land_barra(args.mask, args.file, t)
-        shutil.move(args.file.as_posix(), args.file.as_posix().replace('.tmp', ''))
-    elif "astart" in args.type:
-        print("Fields not swapped out for ECCB files when using start dump as replacement option.")
-    else:
-        print("No need to swap out IC")
+    if len(args.file) != len(args.start):
+        parser.error("--file and --start must be given the same number of values")
+    jobs = list(zip(args.file, args.start))
+    if args.manifest is not None:
+        jobs += read_manifest(args.manifest)
+    if not jobs:
+        parser.error("either --file and --start or --manifest are required")
+    args_end = time.perf_counter()
+
+    with profile(args.profile, 'hres_eccb', args.cprofile) as run_profile:
+        if run_profile is not None:
+            run_profile.record('args', args_start, args_end)
+
+        # Import the backend of the requested replacement only
+        swap = None
+        with span('imports'):
+            if "era5land" in args.type:
+                from replace_landsurface.replace_landsurface_with_ERA5land_IC import swap_land_era5land as swap
+            elif "barra" in args.type:
+                from replace_landsurface.replace_landsurface_with_BARRA2R_IC import swap_land_barra as swap
+            if swap is not None:
+                from replace_landsurface.datasets import run_datasets
+
+        # Share the archive datasets across all the files
+        with run_datasets(chunked=args.chunked) if swap is not None else nullcontext() as datasets:
+            for file, start in jobs:
+
+                # Convert the date/time to a formatted string
+                t = start.strftime("%Y%m%dT%H%MZ")
+                print(args.mask, file, t)
+
+                # If necessary replace ERA5 land/surface fields with higher-resolution options
+                with span('swap', type=args.type, file=file, start=t) as attrs:
+                    if swap is not None:
+                        swap(args.mask, file, t, datasets, workers=args.workers, pipeline=args.pipeline, patch=args.patch, land_only=args.land_only, max_memory=args.max_memory)
+                        shutil.move(file.as_posix(), file.as_posix().replace('.tmp', ''))
+                    elif "astart" in args.type:
+                        print("Fields not swapped out for ECCB files when using start dump as replacement option.")
+                    else:
+                        print("No need to swap out IC")
+                    attrs['peak_rss'] = peak_rss()
+
+        # Report the peak memory of the run (to size the memory requests of the tasks)
+        print(f'Peak memory (RSS): {peak_rss()/2**20:.1f} MB')
 
 if __name__ == '__main__':
     main()
-
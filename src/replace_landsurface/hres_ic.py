@@ -12,15 +12,16 @@ era5-land or BARRA2-R data (if requested).
 
 import argparse
 import shutil
+import sys
+import time
 from pathlib import Path
 
-import pandas
+from replace_landsurface.dates import parse_start
+from replace_landsurface.memory import parse_size, peak_rss
+from replace_landsurface.profiling import profile, span
+from replace_landsurface.server import submit
 
-from replace_landsurface import (
-    replace_landsurface_with_BARRA2R_IC,
-    replace_landsurface_with_ERA5land_IC,
-    replace_landsurface_with_FF_IC,
-)
+# The backends (and their dependencies) are only imported when selected by --type
 
 def main():
 
@@ -37,33 +38,88 @@ def main():
     None.  The astart file is updated and overwritten
     """ 
 
+    # Run the job on the server if one is configured (see replace_landsurface.server)
+    status = submit('hres_ic', sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
     # Parse the command-line arguments
+    args_start = time.perf_counter()
     parser = argparse.ArgumentParser()
-    parser.add_argument('--mask', required=True, type=Path)
-    parser.add_argument('--file', required=True, type=Path)
-    parser.add_argument('--start', required=True, type=pandas.to_datetime)
+    parser.add_argument('--mask', required=True, type=Path, nargs='+', help='Mask of the domain (one per file for several domains)')
+    parser.add_argument('--file', required=True, type=Path, nargs='+', help='File of the domain (several domains read the archive once, with era5land or barra)')
+    parser.add_argument('--start', required=True, type=parse_start)
     parser.add_argument('--type', default="era5land")
     parser.add_argument('--hres_ic', type=Path)
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes reading the archive files in parallel (threads sharing the open archive files, one per file up to the number of CPUs, by default; threads reading the source data with --pipeline)')
+    parser.add_argument('--pipeline', action='store_true', help='Overlap the reads of the source data with the merges and the writing of the output file')
+    parser.add_argument('--chunked', action='store_true', help='Read the archive files by chunks (as laid out on disk) with dask')
+    parser.add_argument('--land-only', action='store_true', help='Only replace the land points of the mask (ERA5-land and BARRA2-R)')
+    parser.add_argument('--patch', action='store_true', help='Rewrite the replaced records in place in a copy of the input file when they fit (the unchanged records are copied otherwise)')
+    parser.add_argument('--max-memory', type=parse_size, help='Stream the fields one at a time, reading the source data by level (or by tiles of rows) within this budget (e.g. 512M, 2G; ERA5-land and BARRA2-R)')
+    parser.add_argument('--profile', type=Path, help='Append timing spans of the phases of the run to this file (JSON lines)')
+    parser.add_argument('--cprofile', type=Path, help='Write cProfile statistics of the run to this file (with --profile)')
     args = parser.parse_args()
     print(args)
 
-    # Convert the date/time to a formatted string
-    t = args.start.strftime("%Y%m%dT%H%MZ")
-    print(args.mask, args.file, t)
-
-    # If necessary replace ERA5 land/surface fields with higher-resolution options
-    if "era5land" in args.type:
-        replace_landsurface_with_ERA5land_IC.swap_land_era5land(args.mask, args.file, t)
-        shutil.move(args.file.as_posix(), args.file.as_posix().replace('.tmp', ''))
-    elif "barra" in args.type:
-        replace_landsurface_with_BARRA2R_IC.swap_land_barra(args.mask, args.file, t)
-        shutil.move(args.file.as_posix(), args.file.as_posix().replace('.tmp', ''))
-    elif "astart" in args.type:
-        replace_landsurface_with_FF_IC.swap_land_ff(args.mask, args.file, args.hres_ic,t)
-        shutil.move(args.file.as_posix(), args.file.as_posix().replace('.tmp', ''))
-
-    else:
-        print("No need to swap out IC")
+    if len(args.mask) != len(args.file):
+        parser.error("--mask and --file must be given the same number of values")
+    domains = list(zip(args.mask, args.file))
+    if len(domains) > 1:
+        if not ("era5land" in args.type or "barra" in args.type):
+            parser.error("several domains are only supported with --type era5land or barra")
+        if args.pipeline or args.max_memory:
+            parser.error("--pipeline and --max-memory are not supported with several domains")
+    args_end = time.perf_counter()
+
+    with profile(args.profile, 'hres_ic', args.cprofile) as run_profile:
+        if run_profile is not None:
+            run_profile.record('args', args_start, args_end)
+
+        # Convert the date/time to a formatted string
+        t = args.start.strftime("%Y%m%dT%H%MZ")
+        for mask, file in domains:
+            print(mask, file, t)
+        mask, file = domains[0]
+
+        # If necessary replace ERA5 land/surface fields with higher-resolution options
+        with span('swap', type=args.type, file=args.file, start=t) as attrs:
+            if "era5land" in args.type:
+                with span('imports'):
+                    from replace_landsurface.datasets import run_datasets
+                    from replace_landsurface.replace_landsurface_with_ERA5land_IC import swap_land_era5land, swap_land_era5land_domains
+                with run_datasets(chunked=args.chunked) as datasets:
+                    if len(domains) > 1:
+                        # Read the archive once for all the domains
+                        swap_land_era5land_domains(domains, t, datasets, workers=args.workers, patch=args.patch, land_only=args.land_only)
+                    else:
+                        swap_land_era5land(mask, file, t, datasets, workers=args.workers, pipeline=args.pipeline, patch=args.patch, land_only=args.land_only, max_memory=args.max_memory)
+                for _, file in domains:
+                    shutil.move(file.as_posix(), file.as_posix().replace('.tmp', ''))
+            elif "barra" in args.type:
+                with span('imports'):
+                    from replace_landsurface.datasets import run_datasets
+                    from replace_landsurface.replace_landsurface_with_BARRA2R_IC import swap_land_barra, swap_land_barra_domains
+                with run_datasets(chunked=args.chunked) as datasets:
+                    if len(domains) > 1:
+                        # Read the archive once for all the domains
+                        swap_land_barra_domains(domains, t, datasets, workers=args.workers, patch=args.patch, land_only=args.land_only)
+                    else:
+                        swap_land_barra(mask, file, t, datasets, workers=args.workers, pipeline=args.pipeline, patch=args.patch, land_only=args.land_only, max_memory=args.max_memory)
+                for _, file in domains:
+                    shutil.move(file.as_posix(), file.as_posix().replace('.tmp', ''))
+            elif "astart" in args.type:
+                with span('imports'):
+                    from replace_landsurface.replace_landsurface_with_FF_IC import swap_land_ff
+                swap_land_ff(mask, file, args.hres_ic,t, pipeline=args.pipeline, patch=args.patch)
+                shutil.move(file.as_posix(), file.as_posix().replace('.tmp', ''))
+
+            else:
+                print("No need to swap out IC")
+            attrs['peak_rss'] = peak_rss()
+
+        # Report the peak memory of the run (to size the memory requests of the tasks)
+        print(f'Peak memory (RSS): {peak_rss()/2**20:.1f} MB')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,235 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Helpers to read the domain mask without building iris cubes.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from replace_landsurface.profiling import traced
+
+# STASH item codes (section 0) of the mask variables that can be read from the UM header
+MASK_STASH = {
+    'land_binary_mask': 30,
+}
+
+# First bytes of the NetCDF (classic/64-bit offset) and HDF5 (NetCDF4) formats
+NETCDF_MAGIC = (b'CDF\x01', b'CDF\x02', b'CDF\x05', b'\x89HDF')
+
+# UM real missing data indicator (used for the spacing of variable resolution grids)
+RMDI = -1073741824.0
+
+
+def _is_netcdf(maskfname):
+    with open(maskfname, 'rb') as f:
+        return f.read(4) in NETCDF_MAGIC
+
+
+def _find_mask_field_um(maskfname, var):
+    """
+    Find the field of the mask variable in a UM file (None if the mask variable is not found).
+    """
+    import mule
+
+    if var not in MASK_STASH:
+        return None
+    fields = [f for f in mule.load_umfile(maskfname).fields
+              if f.lbrel in (2, 3) and f.lbuser4 == MASK_STASH[var]]
+    if not fields:
+        return None
+    return fields[0]
+
+
+def _read_mask_coords_um(maskfname, var):
+    """
+    Compute the coordinates of the mask from the lookup header of the UM field, without reading the data.
+
+    Returns None if the mask is not on a regular (unrotated) lat/lon grid.
+    """
+    f = _find_mask_field_um(maskfname, var)
+    if f is None:
+        return None
+    # Only regular lat/lon grids (variable resolution grids have no regular spacing)
+    if f.lbcode != 1 or f.bdx in (0, RMDI) or f.bdy in (0, RMDI):
+        return None
+    lons = f.bzx + f.bdx * np.arange(1, f.lbnpt + 1)
+    lats = f.bzy + f.bdy * np.arange(1, f.lbrow + 1)
+    return lons, lats
+
+
+def _read_mask_coords_netcdf(maskfname, var):
+    """
+    Read the coordinates of the mask variable from a NetCDF file.
+    """
+    import xarray as xr
+
+    with xr.open_dataset(maskfname, decode_times=False) as d:
+        da = d[var]
+        coords = {}
+        for name in da.dims:
+            if name not in d.variables:
+                continue
+            standard_name = d[name].attrs.get('standard_name', name)
+            if standard_name in ('longitude', 'latitude'):
+                coords[standard_name] = d[name].values
+    if len(coords) != 2:
+        return None
+    return coords['longitude'], coords['latitude']
+
+
+def _read_mask_coords_iris(maskfname, var):
+    """
+    Read the coordinates of the mask through iris (any format iris can load).
+    """
+    import iris
+    import xarray as xr
+
+    d = iris.load(maskfname, var)
+    d = d[0]
+    d = xr.DataArray.from_iris(d)
+    lons = d['longitude'].data
+    lats = d['latitude'].data
+    d.close()
+    return lons, lats
+
+
+@traced('mask', 'maskfname')
+def read_mask_extent(maskfname, var):
+    """
+    Function to get the minimum/maximum latitude and longitude of the domain mask.
+
+    UM ancillaries are read with mule from the field header and NetCDF masks through
+    their coordinates. Other cases fall back to loading the mask with iris.
+
+    Parameters
+    ----------
+    maskfname : POSIX string
+        POSIX path to the mask defining the spatial extent
+    var : string
+        The name of the mask variable that defines the spatial extent
+
+    Returns
+    -------
+    tuple of float
+        The lonmin, lonmax, latmin and latmax of the mask
+    """
+    if _is_netcdf(maskfname):
+        coords = _read_mask_coords_netcdf(maskfname, var)
+    else:
+        try:
+            coords = _read_mask_coords_um(maskfname, var)
+        except (ValueError, OSError):
+            # Not a file mule can read
+            coords = None
+    if coords is None:
+        coords = _read_mask_coords_iris(maskfname, var)
+    lons, lats = coords
+    return np.min(lons), np.max(lons), np.min(lats), np.max(lats)
+
+
+def _read_mask_data_um(maskfname, var):
+    """
+    Read the values of the mask from a UM file (None if the mask variable is not found).
+    """
+    f = _find_mask_field_um(maskfname, var)
+    if f is None:
+        return None
+    return f.get_data()
+
+
+def _read_mask_data_netcdf(maskfname, var):
+    """
+    Read the values of the mask from a NetCDF file (south to north, as in the UM files).
+    """
+    import xarray as xr
+
+    with xr.open_dataset(maskfname, decode_times=False) as d:
+        da = d[var].squeeze()
+        data = da.values
+        for axis, name in enumerate(da.dims):
+            if name in d.variables and d[name].attrs.get('standard_name', name) == 'latitude':
+                lats = d[name].values
+                if lats.size > 1 and lats[0] > lats[-1]:
+                    data = np.flip(data, axis)
+    return data
+
+
+def _read_mask_data_iris(maskfname, var):
+    """
+    Read the values of the mask through iris (any format iris can load).
+    """
+    import iris
+
+    return iris.load(maskfname, var)[0].data
+
+
+class LandPoints():
+    """ Container class to hold the indices of the land points of a domain."""
+    def __init__(self, land):
+        """
+        Initialization function for LandPoints class
+
+        Parameters
+        ----------
+        land : 2d numpy array
+            True (or non-zero) at the land points of the domain
+
+        Returns
+        -------
+        None.
+        """
+        self.shape = land.shape
+        self.rows, self.cols = np.nonzero(land)
+        self.rows.flags.writeable = False
+        self.cols.flags.writeable = False
+
+    @property
+    def fraction(self):
+        """ Fraction of the points of the domain that are land points."""
+        return self.rows.size / max(self.shape[0] * self.shape[1], 1)
+
+    def tile(self, start, stop):
+        """ The land points of the rows start to stop-1 (numbered from start)."""
+        keep = (self.rows >= start) & (self.rows < stop)
+        tile = LandPoints.__new__(LandPoints)
+        tile.shape = (stop - start, self.shape[1])
+        tile.rows, tile.cols = self.rows[keep] - start, self.cols[keep]
+        return tile
+
+
+@lru_cache(maxsize=None)
+@traced('mask', 'maskfname')
+def land_points(maskfname, var):
+    """
+    Function to get the land points of the domain mask (read once per run).
+
+    Parameters
+    ----------
+    maskfname : POSIX string
+        POSIX path to the mask defining the spatial extent
+    var : string
+        The name of the mask variable
+
+    Returns
+    -------
+    LandPoints
+        The indices of the land points
+    """
+    data = None
+    if _is_netcdf(maskfname):
+        data = _read_mask_data_netcdf(maskfname, var)
+    else:
+        try:
+            data = _read_mask_data_um(maskfname, var)
+        except (ValueError, OSError):
+            # Not a file mule can read
+            data = None
+    if data is None:
+        data = _read_mask_data_iris(maskfname, var)
+    data = np.ma.filled(np.squeeze(data), 0)
+    return LandPoints(data > 0)
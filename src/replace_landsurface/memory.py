@@ -0,0 +1,72 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Memory budget of the streaming mode, and peak memory of the process.
+"""
+
+import argparse
+import resource
+import sys
+
+# Multipliers of the units of the memory sizes given on the command line
+MEMORY_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(value):
+    """
+    Function to parse a memory size given on the command line.
+
+    Parameters
+    ----------
+    value : string
+        The size in bytes, or with a K, M, G or T suffix (e.g. "512M", "2G", "1.5GB")
+
+    Returns
+    -------
+    int
+        The size in bytes
+    """
+    number = value.strip().upper()
+    if number.endswith('B'):
+        number = number[:-1]
+    unit = number[-1:] if number[-1:] in MEMORY_UNITS else ''
+    try:
+        size = int(float(number[:len(number)-len(unit)]) * MEMORY_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid memory size: {value!r}")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"memory size must be positive: {value!r}")
+    return size
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process so far, in bytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In kilobytes on Linux, in bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def tile_rows(nrows, row_bytes, max_memory):
+    """
+    Function to find the number of rows of a field read at once within a memory budget.
+
+    Parameters
+    ----------
+    nrows : int
+        The number of rows of the field
+    row_bytes : int
+        The size in bytes of a row
+    max_memory : int
+        The memory budget in bytes for the data read at once
+
+    Returns
+    -------
+    int
+        The number of rows of each tile (all the rows if the field fits in the budget, at least one)
+    """
+    return min(nrows, max(1, max_memory // max(row_bytes, 1)))
@@ -0,0 +1,91 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Merge of the high-resolution data into the current data of a field.
+"""
+
+import numpy as np
+
+# Number of points merged at a time (the temporaries are limited to a block)
+BLOCK_SIZE = 65536
+
+
+def merge_data(current_data, data, multiplier=None, out=None):
+    """
+    Function to merge the (scaled) high-resolution data into the current data of a field,
+    keeping the current data where the high-resolution data is missing (NaN).
+
+    The result is written into a single output array, processed by blocks of rows so
+    that the scaling, the NaN test and the selection only need block-sized temporaries.
+    The result is the same as np.where(np.isnan(data), current_data, data * multiplier).
+
+    Parameters
+    ----------
+    current_data : 2d numpy array
+        The current data of the field
+    data : 2d numpy array
+        The high-resolution data (NaN where missing)
+    multiplier : float, optional
+        Scaling of the high-resolution data (no scaling if None)
+    out : 2d numpy array, optional
+        Array to write the result into (allocated if None). It can be current_data itself if writeable.
+
+    Returns
+    -------
+    2d numpy array
+        The merged data
+    """
+    if out is None:
+        dtype = np.result_type(current_data, data)
+        out = np.empty(current_data.shape, dtype=dtype.newbyteorder('='))
+    rows = max(1, BLOCK_SIZE // max(current_data.shape[-1], 1))
+    for start in range(0, current_data.shape[0], rows):
+        block = slice(start, start + rows)
+        block_data = data[block]
+        if multiplier is not None:
+            block_data = block_data * multiplier
+        np.copyto(out[block], np.where(np.isnan(block_data), current_data[block], block_data))
+    return out
+
+
+def merge_points(current_data, data, points, multiplier=None, out=None):
+    """
+    Function to merge the (scaled) high-resolution data into the current data of a field
+    at the land points only, keeping the current data elsewhere and where the
+    high-resolution data is missing (NaN).
+
+    Parameters
+    ----------
+    current_data : 2d numpy array
+        The current data of the field
+    data : 2d numpy array
+        The high-resolution data (NaN where missing)
+    points : LandPoints
+        The land points of the domain
+    multiplier : float, optional
+        Scaling of the high-resolution data (no scaling if None)
+    out : 2d numpy array, optional
+        Array to write the result into (allocated if None). It can be current_data itself if writeable.
+
+    Returns
+    -------
+    2d numpy array
+        The merged data
+    """
+    if current_data.shape != points.shape or data.shape != points.shape:
+        raise ValueError(f"Land mask of shape {points.shape} does not match the data "
+                         f"of shape {current_data.shape} and {data.shape}.")
+    if out is None:
+        dtype = np.result_type(current_data, data)
+        out = np.empty(current_data.shape, dtype=dtype.newbyteorder('='))
+    if out is not current_data:
+        np.copyto(out, current_data)
+    values = data[points.rows, points.cols]
+    if multiplier is not None:
+        values = values * multiplier
+    valid = ~np.isnan(values)
+    out[points.rows[valid], points.cols[valid]] = values[valid]
+    return out
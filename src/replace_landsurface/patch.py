@@ -0,0 +1,285 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Write the output UM file by copying the records of the unchanged fields as raw
+bytes from the input file, instead of rewriting every field with mule.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from replace_landsurface.profiling import traced
+
+# Size in bytes of a word of a UM file
+WORD_SIZE = 8
+
+# Size in bytes of the blocks copied between files
+COPY_BLOCK_SIZE = 64 * 1024 * 1024
+
+# Position (0-based) of the data length in the fixed length header
+DATA_DIM1 = 160
+
+# Positions (0-based) of the record information in the integer part of a lookup entry
+LBLREC = 14
+LBEGIN = 28
+LBNREC = 29
+
+
+def _pack_data(f, data):
+    """
+    Pack the data of a field as it is stored on disk.
+
+    Only unpacked (lbpack=0) and WGDOS packed (lbpack=1) fields are supported.
+
+    Returns
+    -------
+    bytes or None
+        The packed data (padded to a whole number of words), or None if the packing is not supported.
+    """
+    lbpack = f.lbpack % 1000
+    if data.size != f.lbrow * f.lbnpt:
+        return None
+    if lbpack == 0:
+        # lbuser1 is 2 for integer fields (1 for real fields)
+        dtype = '>i8' if f.lbuser1 == 2 else '>f8'
+        payload = np.ascontiguousarray(data, dtype=dtype).tobytes()
+    elif lbpack == 1:
+        from mule.packing import wgdos_pack
+        payload = wgdos_pack(np.asarray(data, dtype=np.float64), f.bmdi, f.bacc)
+    else:
+        return None
+    return payload + b'\0' * (-len(payload) % WORD_SIZE)
+
+
+def _read_lookup(ff_in, mf_in):
+    """
+    Read the lookup table of a UM file as a 2-D array of integers (one row per entry).
+    """
+    flh = mf_in.fixed_length_header
+    offset = (flh.lookup_start - 1) * WORD_SIZE
+    lookup = np.fromfile(ff_in, dtype='>i8', count=flh.lookup_dim1 * flh.lookup_dim2, offset=offset)
+    return offset, lookup.reshape(flh.lookup_dim2, flh.lookup_dim1)
+
+
+def _copy_range(src, dst, offset, nbytes):
+    """
+    Copy a range of bytes of a file to the current position of another file.
+    """
+    src.seek(offset)
+    dst.flush()
+    if hasattr(os, 'copy_file_range'):
+        # Copy within the kernel (no data goes through Python)
+        out_offset = dst.tell()
+        try:
+            while nbytes > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), nbytes, offset, out_offset)
+                if copied == 0:
+                    break
+                nbytes -= copied
+                offset += copied
+                out_offset += copied
+        except OSError:
+            # Not supported by the filesystem: copy the rest in Python
+            pass
+        dst.seek(out_offset)
+        src.seek(offset)
+    while nbytes > 0:
+        block = src.read(min(nbytes, COPY_BLOCK_SIZE))
+        if not block:
+            break
+        dst.write(block)
+        nbytes -= len(block)
+
+
+def _record_size(lblrec, lbnrec):
+    """
+    Size in words of a record on disk (lbnrec is 0 if the records are not padded).
+    """
+    return lbnrec if lbnrec > 0 else lblrec
+
+
+def _sector_size(lookup, order):
+    """
+    Size in words of the sectors the records of a UM file are aligned to, from the layout of the file:
+    the greatest common divisor of the padded record sizes and of the record positions
+    (relative to the first record). 0 if the records are not padded.
+    """
+    lbnrec = lookup[order, LBNREC]
+    if not np.any(lbnrec > 0):
+        return 0
+    offsets = lookup[order, LBEGIN] - lookup[order[0], LBEGIN]
+    return int(np.gcd.reduce(np.concatenate((lbnrec[lbnrec > 0], offsets))))
+
+
+def passthrough_fields(mf_in, ff_in, ff_out, replacements):
+    """
+    Function to write a copy of a UM file with the data of some fields replaced,
+    copying the records of all the other fields as raw bytes.
+
+    The records are written in the same order as in the input file. Only the
+    replaced fields are packed, and the lookup table and fixed length header
+    are updated for the new record positions and lengths. Consecutive unchanged
+    records are copied in a single block. The replaced records are padded to the
+    sectors of the input file if its records are padded.
+
+    Parameters
+    ----------
+    mf_in : mule UMFile
+        The input file
+    ff_in : POSIX string
+        POSIX path to the input file
+    ff_out : POSIX string
+        POSIX path to the output file
+    replacements : list of (mule Field, numpy array)
+        The fields of the input file to replace and their new data
+
+    Returns
+    -------
+    bool
+        True if the output file was written, False if a replaced field uses an unsupported packing.
+    """
+    offset, lookup = _read_lookup(ff_in, mf_in)
+    rows = {lbegin: row for row, lbegin in enumerate(lookup[:, LBEGIN]) if lbegin > 0}
+
+    # Pack the replaced records first, so that nothing is written if any of them is not supported
+    payloads = {}
+    for f, data in replacements:
+        payload = _pack_data(f, data)
+        if payload is None or f.lbegin not in rows:
+            return False
+        payloads[rows[f.lbegin]] = payload
+
+    # Lay out the records in the order of the input file
+    order = sorted(rows.values(), key=lambda row: lookup[row, LBEGIN])
+    if not order:
+        return False
+    new_lookup = lookup.copy()
+    sector = _sector_size(lookup, order)
+    first_record = int(lookup[order[0], LBEGIN])
+    position = first_record
+    # Rows of the replaced records, and blocks of unchanged records as [start, size] in words
+    segments = []
+    for row in order:
+        lbegin, lblrec, lbnrec = (int(v) for v in lookup[row, [LBEGIN, LBLREC, LBNREC]])
+        new_lookup[row, LBEGIN] = position
+        if row in payloads:
+            nwords = len(payloads[row]) // WORD_SIZE
+            new_lookup[row, LBLREC] = nwords
+            if lbnrec > 0:
+                new_lookup[row, LBNREC] = -(-nwords // sector) * sector
+            segments.append(row)
+        elif segments and isinstance(segments[-1], list) and sum(segments[-1]) == lbegin:
+            # Contiguous with the previous unchanged record
+            segments[-1][1] += _record_size(lblrec, lbnrec)
+        else:
+            segments.append([lbegin, _record_size(lblrec, lbnrec)])
+        position += _record_size(int(new_lookup[row, LBLREC]), int(new_lookup[row, LBNREC]))
+
+    with open(ff_in, 'rb') as src, open(ff_out, 'wb') as dst:
+        # Headers and lookup table (up to the first record)
+        _copy_range(src, dst, 0, first_record * WORD_SIZE)
+        for segment in segments:
+            if isinstance(segment, list):
+                _copy_range(src, dst, segment[0] * WORD_SIZE, segment[1] * WORD_SIZE)
+            else:
+                size = _record_size(int(new_lookup[segment, LBLREC]), int(new_lookup[segment, LBNREC]))
+                dst.write(payloads[segment].ljust(size * WORD_SIZE, b'\0'))
+        dst.seek(offset)
+        dst.write(new_lookup.tobytes())
+        dst.seek(DATA_DIM1 * WORD_SIZE)
+        dst.write(np.array(position - (mf_in.fixed_length_header.data_start - 1), dtype='>i8').tobytes())
+    return True
+
+
+def patch_fields(mf_in, ff_in, ff_out, replacements):
+    """
+    Function to write a copy of a UM file with the data of some fields replaced in place.
+
+    Each replaced record is overwritten in the copy, and its length updated in the
+    lookup table. Nothing is written if any of the new records does not fit in the
+    space allocated to the field on disk, or uses an unsupported packing.
+
+    Parameters
+    ----------
+    mf_in : mule UMFile
+        The input file
+    ff_in : POSIX string
+        POSIX path to the input file
+    ff_out : POSIX string
+        POSIX path to the output file
+    replacements : list of (mule Field, numpy array)
+        The fields of the input file to replace and their new data
+
+    Returns
+    -------
+    bool
+        True if the output file was written, False if the records could not be patched.
+    """
+    offset, lookup = _read_lookup(ff_in, mf_in)
+    rows = {lbegin: row for row, lbegin in enumerate(lookup[:, LBEGIN]) if lbegin > 0}
+
+    # Pack all the records first, so that nothing is written if any of them does not fit
+    records = []
+    for f, data in replacements:
+        payload = _pack_data(f, data)
+        if payload is None or f.lbegin not in rows:
+            return False
+        # Space allocated on disk
+        capacity = _record_size(f.lblrec, f.lbnrec)
+        nwords = len(payload) // WORD_SIZE
+        if nwords > capacity:
+            return False
+        records.append((rows[f.lbegin], f.lbegin, f.lblrec, nwords, payload.ljust(capacity * WORD_SIZE, b'\0')))
+
+    shutil.copyfile(ff_in, ff_out)
+    with open(ff_out, 'r+b') as out:
+        for row, lbegin, lblrec, nwords, payload in records:
+            out.seek(lbegin * WORD_SIZE)
+            out.write(payload)
+            if nwords != lblrec:
+                out.seek(offset + (row * lookup.shape[1] + LBLREC) * WORD_SIZE)
+                out.write(np.array(nwords, dtype='>i8').tobytes())
+    return True
+
+
+@traced('write', 'ff_out')
+def write_fields(mf_in, mf_out, ff_in, ff_out, replacements, patch=False):
+    """
+    Function to write the output UM file, copying the records of the unchanged fields as raw bytes.
+    The file is rewritten with mule if the packing of a replaced field is not supported.
+
+    Parameters
+    ----------
+    mf_in : mule UMFile
+        The input file
+    mf_out : mule UMFile
+        The output file, holding all the fields (replaced or not)
+    ff_in : POSIX string
+        POSIX path to the input file
+    ff_out : POSIX string
+        POSIX path to the output file
+    replacements : list of (mule Field, numpy array) or None
+        The fields of the input file that are replaced and their new data.
+        None if the new data is only computed when the fields are written (the file is then written by mule).
+    patch : bool, optional
+        If True, first try to patch the replaced records in place in a copy of the input file.
+
+    Returns
+    -------
+    None.
+    """
+    if replacements is not None:
+        if patch and patch_fields(mf_in, ff_in, ff_out, replacements):
+            print(f'Patched {len(replacements)} fields in {ff_out}')
+            return
+        if passthrough_fields(mf_in, ff_in, ff_out, replacements):
+            print(f'Rewrote {ff_out} copying the unchanged fields')
+            return
+        print(f'Fields cannot be copied as raw bytes, rewriting {ff_out}')
+    mf_out.validate = lambda *args, **kwargs: True
+    mf_out.to_file(ff_out)
@@ -0,0 +1,174 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Pipelined processing of the fields of a UM file, overlapping the reads of the
+source data, the merges and the writing of the output file.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import mule
+
+from replace_landsurface.profiling import span
+from replace_landsurface.records import read_field_data
+
+
+class StageTimer():
+    """
+    Container class to accumulate the time spent in each stage of the pipeline (thread-safe).
+    Each timed block is also recorded as a "pipeline.<stage>" span of the open profile.
+    """
+    def __init__(self):
+        self.times = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            with span('pipeline.' + stage):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.times[stage] = self.times.get(stage, 0.) + elapsed
+
+    def timed(self, stage, func, *args):
+        """ Call a function, adding its run time to a stage."""
+        with self(stage):
+            return func(*args)
+
+
+class DeferredReplaceOperator(mule.DataOperator):
+    """ Mule operator replacing the data with the result of a future, resolved when the field is written."""
+    def __init__(self, timer):
+        self.timer = timer
+    def new_field(self, sources):
+        return sources[0]
+    def transform(self, sources, result):
+        with self.timer('write_wait'):
+            return sources[1].result()
+
+
+class FieldPipeline():
+    """
+    Overlapped read/merge/write of the fields of a UM file.
+
+    Source reads run in a pool of threads as soon as they are scheduled. Merges
+    run in a separate thread, in field order, as soon as their source data is
+    available. The output file is written by mule in the calling thread while
+    later fields are still being read and merged: each replaced field waits for
+    its merge only when mule reaches it.
+    """
+    def __init__(self, ff_in, workers=2):
+        """
+        Initialization function for FieldPipeline class
+
+        Parameters
+        ----------
+        ff_in : POSIX string
+            POSIX path to the input UM file
+        workers : int, optional
+            Number of threads reading the source data
+
+        Returns
+        -------
+        None.
+        """
+        self.timer = StageTimer()
+        self._start = time.perf_counter()
+        # Separate handle to read the current data, as mule reads the input file while writing
+        self._ff_in = ff_in
+        self._mf_read = mule.load_umfile(ff_in)
+        self._read_pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        self._merge_pool = ThreadPoolExecutor(max_workers=1)
+        self._operator = DeferredReplaceOperator(self.timer)
+
+    def read(self, func, *args):
+        """
+        Schedule the read of source data.
+
+        Parameters
+        ----------
+        func : callable
+            Function returning the source data
+        *args
+            Arguments to the function
+
+        Returns
+        -------
+        Future
+            The future source data
+        """
+        return self._read_pool.submit(self.timer.timed, 'read', func, *args)
+
+    def replace(self, f, index, source, merge):
+        """
+        Schedule the merge of the source data into a field.
+
+        Parameters
+        ----------
+        f : mule Field
+            The field to replace
+        index : int
+            The position of the field in the input file
+        source : Future
+            The future source data, as returned by read
+        merge : callable or None
+            Function merging the source data into the current data, called as merge(current_data, source_data).
+            If None, the source data replaces the field entirely (and its current data is not read).
+
+        Returns
+        -------
+        mule Field
+            The field to append to the output file
+        """
+        future = self._merge_pool.submit(self._merge, index, source, merge)
+        return self._operator([f, future])
+
+    def _merge(self, index, source, merge):
+        data = source.result()
+        if merge is None:
+            return data
+        with self.timer('get_data'):
+            current_data = read_field_data(self._mf_read.fields[index], self._ff_in)
+        with self.timer('merge'):
+            return merge(current_data, data)
+
+    def write(self, mf_out, ff_out):
+        """
+        Write the output file and report the time spent in each stage.
+
+        Parameters
+        ----------
+        mf_out : mule UMFile
+            The output file, holding the fields returned by replace
+        ff_out : POSIX string
+            POSIX path to the output file
+
+        Returns
+        -------
+        dict
+            The time spent in each stage, the wall time and the time overlapped between stages.
+        """
+        try:
+            mf_out.validate = lambda *args, **kwargs: True
+            with self.timer('write'):
+                mf_out.to_file(ff_out)
+        finally:
+            self._read_pool.shutdown(cancel_futures=True)
+            self._merge_pool.shutdown(cancel_futures=True)
+        times = dict(self.timer.times)
+        times['wall'] = time.perf_counter() - self._start
+        # Time the writer spent doing work rather than waiting for merges
+        times['write'] -= times.get('write_wait', 0.)
+        busy = sum(times.get(stage, 0.) for stage in ('read', 'get_data', 'merge', 'write'))
+        times['overlapped'] = max(busy - times['wall'], 0.)
+        print('Pipeline timings (s): ' + ', '.join(f'{stage} {t:.3f}' for stage, t in times.items()))
+        return times
@@ -0,0 +1,182 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Timing spans of the phases of a run, written as JSON lines.
+
+Each span records its name, start (seconds since the epoch), duration, thread, the
+enclosing span of the same thread and the bytes read and written by the process
+during the span (from /proc/self/io, so they include the other threads, and not the
+data paged in from memory-mapped files). Spans are only recorded while a profile is
+open, and cost nothing otherwise.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# The open profile (None if not profiling)
+_profile = None
+
+
+def _io_counters():
+    """
+    Bytes read and written by the process so far (None if not available on this platform).
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+class Profile():
+    """ Container class to write the timing spans of a run to a JSON lines file (thread-safe)."""
+    def __init__(self, fname, command, cprofile=None):
+        """
+        Initialization function for Profile class
+
+        Parameters
+        ----------
+        fname : POSIX string
+            POSIX path to the JSON lines file (appended to, so that several runs can be collected)
+        command : string
+            The name of the command, recorded in each span
+        cprofile : POSIX string, optional
+            POSIX path to write the cProfile statistics of the calling thread to
+
+        Returns
+        -------
+        None.
+        """
+        self.command = command
+        self.run = os.urandom(16).hex()
+        self._file = open(fname, 'a')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Offset from the performance counter to the time since the epoch
+        self._epoch = time.time() - time.perf_counter()
+        self._cprofile_fname = cprofile
+        self._cprofile = None
+        if cprofile:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, name, start, end, bytes_read=None, bytes_written=None, **attrs):
+        """
+        Write a span, given its start and end times (from time.perf_counter).
+        """
+        stack = self._stack()
+        span = {'run': self.run, 'command': self.command, 'name': name,
+                'start': round(self._epoch + start, 6), 'duration': round(end - start, 6),
+                'pid': os.getpid(), 'thread': threading.current_thread().name,
+                'parent': stack[-1] if stack else None,
+                'bytes_read': bytes_read, 'bytes_written': bytes_written}
+        span.update(attrs)
+        line = json.dumps(span, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Time a block of code as a span. Attributes can be added to the yielded dictionary.
+        """
+        stack = self._stack()
+        read_start, written_start = _io_counters()
+        start = time.perf_counter()
+        stack.append(name)
+        try:
+            yield attrs
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            read_end, written_end = _io_counters()
+            if read_start is not None:
+                attrs['bytes_read'] = read_end - read_start
+                attrs['bytes_written'] = written_end - written_start
+            self.record(name, start, end, **attrs)
+
+    def close(self):
+        """ Stop profiling, writing the cProfile statistics if requested."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self._cprofile_fname)
+        self._file.close()
+
+
+@contextmanager
+def profile(fname, command, cprofile=None):
+    """
+    Context manager recording the spans of the run while open.
+
+    Parameters
+    ----------
+    fname : POSIX string or None
+        POSIX path to the JSON lines file. If None, no spans are recorded.
+    command : string
+        The name of the command, recorded in each span
+    cprofile : POSIX string, optional
+        POSIX path to write the cProfile statistics to (only if fname is given)
+
+    Returns
+    -------
+    Profile or None
+        The open profile
+    """
+    global _profile
+    if not fname:
+        yield None
+        return
+    _profile = Profile(fname, command, cprofile)
+    try:
+        yield _profile
+    finally:
+        _profile.close()
+        _profile = None
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block of code as a span of the open profile (does nothing if not profiling).
+    Attributes can be added to the yielded dictionary.
+    """
+    if _profile is None:
+        yield attrs
+        return
+    with _profile.span(name, **attrs) as attrs:
+        yield attrs
+
+
+def traced(name, *arg_names):
+    """
+    Decorator timing each call of a function as a span, recording the given arguments as attributes.
+    """
+    def decorator(func):
+        positions = func.__code__.co_varnames[:func.__code__.co_argcount]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return func(*args, **kwargs)
+            bound = dict(zip(positions, args), **kwargs)
+            attrs = {arg_name: bound[arg_name] for arg_name in arg_names if arg_name in bound}
+            with _profile.span(name, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,47 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Direct access to the data records of UM files.
+"""
+
+import numpy as np
+
+# Size in bytes of a word of a UM file
+WORD_SIZE = 8
+
+
+def can_map(f):
+    """
+    True if the data of a real field is stored unpacked as 64-bit words, and can be mapped from the file.
+    """
+    # lbuser1 is 1 for real fields
+    return (f.lbpack == 0 and f.lbuser1 == 1 and f.lbext == 0 and f.lbegin > 0
+            and f.lbrow > 0 and f.lbnpt > 0 and f.lblrec >= f.lbrow * f.lbnpt)
+
+
+def read_field_data(f, fname):
+    """
+    Function to get the data of a field of a UM file.
+
+    Unpacked real fields are mapped read-only from the file with numpy.memmap (the data
+    is only read when used, and the pages can be shared between processes through
+    the page cache). Other fields are read and unpacked by mule.
+
+    Parameters
+    ----------
+    f : mule Field
+        The field to read (loaded from the file)
+    fname : POSIX string
+        POSIX path to the file holding the field
+
+    Returns
+    -------
+    2d numpy array
+        The data of the field (big-endian and read-only if mapped from the file)
+    """
+    if not can_map(f):
+        return f.get_data()
+    return np.memmap(fname, dtype='>f8', mode='r', offset=f.lbegin * WORD_SIZE, shape=(f.lbrow, f.lbnpt))
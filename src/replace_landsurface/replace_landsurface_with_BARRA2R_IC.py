@@ -6,157 +6,46 @@
 # Created by: Chermelle Engel <Chermelle.Engel@anu.edu.au>
 
 import os
-import sys
-from glob import glob
-from pathlib import Path
 
-import iris
-import mule
-import numpy as np
-import xarray as xr
+from replace_landsurface import engine
+from replace_landsurface.cache import CACHE_DIR_ENV, subset_cache_size
+from replace_landsurface.catalogue import BARRA_R2
 
-ROSE_DATA = os.environ.get('ROSE_DATA', "")
-# Base directory of the ERA5-land archive on NCI
-BARRA_DIR = os.path.join(ROSE_DATA, 'etc', 'barra_r2')
+# BARRA2-R variable, frequency (and soil layer) replacing each (STASH code, soil level) of the UM file
+BARRA_TABLE = [
+    # soil moisture
+    *[engine.Replacement(9, level, 'mrsol', '3hr', layer=level-1) for level in range(1, 5)],
+    # soil temperature
+    *[engine.Replacement(20, level, 'tsl', '3hr', layer=level-1) for level in range(1, 5)],
+    # surface temperature
+    engine.Replacement(24, None, 'ts', '1hr'),
+]
 
+# Files of the BARRA2-R archive, relative to its base directory
+BARRA_PATTERN = os.path.join('{freq}', '{var}', 'latest', '{var}*{yyyy}{mm}*nc')
 
-class ReplaceOperator(mule.DataOperator):
-    """ Mule operator for replacing the data"""
-    def __init__(self):
-        pass
-    def new_field(self, sources):
-        #print('new_field')
-        return sources[0]
-    def transform(self, sources, result):
-        #print('transform')
-        return sources[1]
-
-
-class bounding_box(): 
-    """ Container class to hold spatial extent information."""
-    def __init__(self, ncfname, maskfname, var):
-        """
-        Initialization function for bounding_box class
-
-        Parameters
-        ----------
-        ncfname : POSIX string
-            POSIX path to input data (from the NetCDF archive)
-        maskfname : POSIX string
-            POSIX path to mask information to define the data to be cut out
-        var : string
-            The name of the mask variable that defines the spatial extent
-
-        Returns
-        -------
-        None.  The variables describing the spatial extent are definied within bounding box object.
-
-        """
-        # Read in the mask and get the minimum/maximum latitude and longitude information
-        if Path(maskfname).exists():
-            d = iris.load(maskfname, var)
-            d = d[0]
-            d = xr.DataArray.from_iris(d)
-
-            lons = d['longitude'].data
-            lonmin = np.min(lons)
-            lonmax = np.max(lons)
-            lats = d['latitude'].data
-            latmin = np.min(lats)
-            latmax = np.max(lats)
-            d.close()
-        else:
-            print(f'ERROR: File {maskfname} not found', file=sys.stderr)
-            raise
-
-        # Read in the file from the high-res netcdf archive
-        if Path(ncfname).exists():
-            d = xr.open_dataset(ncfname)
-        else:
-            print(f'ERROR: File {ncfname} not found', file=sys.stderr)
-            sys.exit(1)
-
-
-        # Get the longitude information
-        lons = d['lon'].data
-
-        # Coping with numerical inaccuracy
-        adj = (lons[1] - lons[0])/2.
-
-        # Work out which longitudes define the minimum/maximum extents of the grid of interest
-        lonmin_index = np.argwhere( (lons > lonmin - adj) & (lons < lonmin + adj))[0][0]
-        lonmax_index = np.argwhere( (lons > lonmax - adj) & (lons < lonmax + adj))[0][0]
-
-        # Get the latitude information
-        lats = d['lat'].data
-
-        # Work out which longitudes define the minimum/maximum extents of the grid of interest
-        # use the same adjustment as for longitude
-        latmin_index = np.argwhere( (lats > latmin - adj) & (lats < latmin + adj))[0][0]
-        latmax_index = np.argwhere( (lats > latmax - adj) & (lats < latmax + adj))[0][0]
-
-        # Set the boundaries
-        self.lonmin = lonmin_index
-        self.lonmax = lonmax_index
-        self.latmin = latmin_index
-        self.latmax = latmax_index
-
-
-def get_BARRA_nc_data(ncfname, FIELDN, wanted_dt, NLAYERS, bounds):
+def configure():
     """
-    Function to get the BARA2-R data for a single land/surface variable.
-
-    Parameters
-    ----------
-    ncfname : string
-        The name of the file to read
-    FIELDN : string
-        The name of the variable in the file to read
-    wanted_dt : string
-        The date-time required in "%Y%m%d%H%M" format
-    NLAYERS : int
-        The number of layers in the multi-resolution grid (1 or more)
-    bounds : bounding_box object
-        A bounding box object defining the spatial extent to keep
+    Set the configuration of the module from the environment variables.
 
-    Returns
-    -------
-    2d numpy array 
-        A 2-D numpy array containg the field data for the date/time and spatial extent
+    Called when the module is imported, and again before each job run by a server
+    (see replace_landsurface.server), as each job brings its own environment.
     """
+    global ROSE_DATA, BARRA_DIR, CACHE_DIR, SUBSET_CACHE_SIZE, ARCHIVE
+    ROSE_DATA = os.environ.get('ROSE_DATA', "")
+    # Base directory of the BARRA2-R archive on NCI
+    BARRA_DIR = os.path.join(ROSE_DATA, 'etc', 'barra_r2')
+    # Directory to cache the domain bounding box across runs (disabled if empty)
+    CACHE_DIR = os.environ.get(CACHE_DIR_ENV, "")
+    # Maximum size in bytes of the regional subsets of the archive kept in the cache directory (disabled if 0)
+    SUBSET_CACHE_SIZE = subset_cache_size()
+    ARCHIVE = engine.Archive(BARRA_R2, BARRA_DIR, BARRA_PATTERN, BARRA_TABLE, lon='lon', lat='lat',
+                             cache_dir=CACHE_DIR, subset_cache_size=SUBSET_CACHE_SIZE)
 
-    # Open the file containing the data
-    if Path(ncfname).exists():
-        d = xr.open_dataset(ncfname)
-    else:
-        print(f'ERROR: File {ncfname} not found', file=sys.stderr)
-        sys.exit(1)
-    
-    # Find the array index for the date/time of interest
-    times = d['time'].dt.strftime("%Y%m%d%H%M").data
-    TM = times.tolist().index(wanted_dt)
-
-    # retrieve the spatial extends of interest
-    lonmin_index, lonmax_index = bounds.lonmin, bounds.lonmax
-    latmin_index, latmax_index = bounds.latmin, bounds.latmax
-
-    # Read the data
-    try:
-        if NLAYERS>1:
-          data = d[FIELDN][TM, :, latmin_index:latmax_index+1, lonmin_index:lonmax_index+1]
-        else:
-          data = d[FIELDN][TM, latmin_index:latmax_index+1, lonmin_index:lonmax_index+1]
-    except KeyError:
-        print(fname)
-        print(f'ERROR: Variable temp not found in file', file=sys.stderr)
-        sys.exit(1)
-
-    d.close()
+configure()
 
-    return data.data
 
-
-def swap_land_barra(mask_fullpath, ec_cb_file_fullpath, ic_date):
+def swap_land_barra(mask_fullpath, ec_cb_file_fullpath, ic_date, datasets=None, workers=None, pipeline=False, patch=False, land_only=False, max_memory=None):
     """
     Function to get the BARRA2-R data for all land/surface variables.
 
@@ -168,91 +57,57 @@ def swap_land_barra(mask_fullpath, ec_cb_file_fullpath, ic_date):
         Path to file with the coarser resolution data to be replaced with ".tmp" appended at end
     ic_date : string
         The date-time required in "%Y%m%d%H%M" format
+    datasets : DatasetCache, optional
+        Cache of the archive datasets shared across several calls (e.g. in batch mode).
+        If None, the datasets are opened and closed within this call.
+    workers : int, optional
+        Number of processes reading the BARRA2-R files in parallel (threads in pipelined mode).
+        By default, threads sharing the open archive files, one per file up to the number of CPUs.
+    pipeline : bool, optional
+        If True, overlap the reads of the BARRA2-R data with the merges and the writing of the output file
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input file when they fit
+        (not used in pipelined mode)
+    land_only : bool, optional
+        If True, only merge the BARRA2-R data at the land points of the mask
+    max_memory : int, optional
+        If given, stream the fields one at a time, reading the BARRA2-R data by layer
+        (or by tiles of rows) within this budget in bytes
 
     Returns
     -------
     None.
         The file is replaced with a version of itself holding the higher-resolution data.
     """
+    engine.swap_land(ARCHIVE, mask_fullpath, ec_cb_file_fullpath, ic_date, datasets, workers, pipeline, patch, land_only, max_memory)
 
 
-    # create name of file to be replaced
-    ec_cb_file = ec_cb_file_fullpath.parts[-1].replace('.tmp', '')
-   
-    # create date/time useful information
-    yyyy = ic_date[0:4]
-    mm = ic_date[4:6]
-    ic_z_date = ic_date.replace('T', '').replace('Z', '')
-    
-    # Path to input file
-    ff_in = ec_cb_file_fullpath.as_posix().replace('.tmp', '')
-
-    # Path to output file
-    ff_out = ec_cb_file_fullpath.as_posix()
-    #print(ff_in, ff_out)
-    
-    # Read input file
-    mf_in = mule.load_umfile(ff_in)
-    
-    # Create Mule Replacement Operator
-    replace = ReplaceOperator() 
-
-    # Read in the surface temperature data from the archive
-    BARRA_FIELDN = 'ts'
-    indir = os.path.join(BARRA_DIR, '1hr',BARRA_FIELDN, 'latest')
-    barra_files = glob(os.path.join(indir, BARRA_FIELDN + '*' + yyyy + mm + '*nc'))
-    barra_fname = indir + '/' + barra_files[0].split('/')[-1]
-
-    # Work out the grid bounds using the surface temperature file
-    bounds = bounding_box(barra_fname, mask_fullpath.as_posix(), "land_binary_mask")
-
-    # Read in the surface temperature data (and keep to use for replacement)
-    data = get_BARRA_nc_data(barra_fname, BARRA_FIELDN, ic_z_date ,-1 ,bounds)
-    surface_temp = data.copy()
-    
-    # Read in the soil moisture data (and keep to use for replacement)
-    BARRA_FIELDN = 'mrsol'
-    indir = os.path.join(BARRA_DIR, '3hr',BARRA_FIELDN, 'latest')
-    barra_files = glob(os.path.join(indir, BARRA_FIELDN + '*' + yyyy + mm + '*nc'))
-    barra_fname = indir + '/' + barra_files[0].split('/')[-1]
-    data = get_BARRA_nc_data(barra_fname, BARRA_FIELDN, ic_date.replace('T', '').replace('Z', ''), 4, bounds)
-    mrsol = data.copy()
+def swap_land_barra_domains(domains, ic_date, datasets=None, workers=None, patch=False, land_only=False):
+    """
+    Function to get the BARRA2-R data for all land/surface variables of several domains,
+    reading the BARRA2-R data once over the union of their spatial extents.
 
-    # Read in the soil temperature data (and keep to use for replacement)
-    BARRA_FIELDN = 'tsl'
-    indir = os.path.join(BARRA_DIR, '3hr',BARRA_FIELDN, 'latest')
-    barra_files = glob(os.path.join(indir, BARRA_FIELDN + '*' + yyyy + mm + '*nc'))
-    barra_fname = indir + '/' + barra_files[0].split('/')[-1]
-    data = get_BARRA_nc_data(barra_fname, BARRA_FIELDN, ic_date.replace('T', '').replace('Z', ''), 4, bounds)
-    tsl = data.copy()
-    
-    # Set up the output file
-    mf_out = mf_in.copy()
+    Parameters
+    ----------
+    domains : list of (Path, Path)
+        The path to the mask defining the spatial extent of each domain, and the path to its file
+        with the coarser resolution data to be replaced (with ".tmp" appended at end)
+    ic_date : string
+        The date-time required in "%Y%m%d%H%M" format
+    datasets : DatasetCache, optional
+        Cache of the archive datasets shared across several calls.
+        If None, the datasets are opened and closed within this call.
+    workers : int, optional
+        Number of processes reading the BARRA2-R files in parallel.
+        By default, threads sharing the open archive files, one per file up to the number of CPUs.
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input files when they fit
+    land_only : bool, optional
+        If True, only merge the BARRA2-R data at the land points of the masks
 
-    # For each field in the input write to the output file (but modify as required)
-    for f in mf_in.fields:
-    
-      #print(f.lbuser4, f.lblev, f.lblrec, f.lbhr, f.lbcode)
-      if f.lbuser4 == 9:
-        # replace coarse soil moisture with high-res information
-        current_data = f.get_data()
-        data = mrsol[f.lblev-1, :, :]
-        data = np.where(np.isnan(data), current_data, data)
-        mf_out.fields.append(replace([f, data]))
-      elif f.lbuser4 == 20:
-        # replace coarse soil temperature with high-res information
-        current_data = f.get_data()
-        data = tsl[f.lblev-1, :, :]
-        data = np.where(np.isnan(data), current_data, data)
-        mf_out.fields.append(replace([f, data]))
-      elif f.lbuser4 == 24:
-        # replace surface temperature with high-res information
-        current_data = f.get_data()
-        data = surface_temp
-        data = np.where(np.isnan(data), current_data, data)
-        mf_out.fields.append(replace([f, data]))
-      else:
-        mf_out.fields.append(f)
-    
-    mf_out.validate = lambda *args, **kwargs: True
-    mf_out.to_file(ff_out)
+    Returns
+    -------
+    None.
+        The files are replaced with versions of themselves holding the higher-resolution data.
+    """
+    engine.swap_land_domains(ARCHIVE, domains, ic_date, datasets, workers, patch, land_only)
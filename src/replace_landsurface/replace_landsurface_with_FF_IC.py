@@ -5,8 +5,16 @@
 #
 # Created by: Chermelle Engel <Chermelle.Engel@anu.edu.au>
 
+import sys
+import threading
+
 import mule
 
+from replace_landsurface.patch import write_fields
+from replace_landsurface.pipeline import FieldPipeline
+from replace_landsurface.profiling import span
+from replace_landsurface.records import read_field_data
+
 class ReplaceOperator(mule.DataOperator):
     """ Mule operator for replacing the data"""
     def __init__(self):
@@ -18,12 +26,73 @@ class ReplaceOperator(mule.DataOperator):
         print('transform')
         return sources[1]
 
-def replace_in_ff_from_ff(f, sf, mf_out, replace):
+# STASH codes of the land/surface fields replaced (soil moisture, soil temperature and surface temperature)
+LAND_STASH = (9, 20, 24)
+
+def validity_time(f):
+    """ Return the validity time of a field from its lookup header."""
+    return (f.lbyr, f.lbmon, f.lbdat, f.lbhr, f.lbmin)
+
+class FieldIndex():
+    """ Container class to look up the land/surface fields of a source file by STASH code, level and validity time."""
+    def __init__(self, fields, stash_codes=LAND_STASH):
+        """
+        Initialization function for FieldIndex class
+
+        Parameters
+        ----------
+        fields : list of mule Field
+            The fields of the source file (only the lookup headers are used)
+        stash_codes : tuple of int, optional
+            The STASH codes of the fields to index
+
+        Returns
+        -------
+        None.
+        """
+        self.by_time = {}
+        self.by_level = {}
+        for sf in fields:
+            if sf.lbuser4 not in stash_codes:
+                continue
+            # Keep the first field if the same record appears several times
+            self.by_time.setdefault((sf.lbuser4, sf.lblev, validity_time(sf)), sf)
+            self.by_level.setdefault((sf.lbuser4, sf.lblev), []).append(sf)
+
+    def find(self, f):
+        """
+        Find the source field replacing a field.
 
-    replacement_data = sf.get_data()
+        Fields are matched on STASH code, level and validity time, or on STASH code and
+        level only if the validity times differ and a single source field has them.
+
+        Parameters
+        ----------
+        f : mule Field
+            The field to replace
+
+        Returns
+        -------
+        mule Field
+            The matching field of the source file
+        """
+        sf = self.by_time.get((f.lbuser4, f.lblev, validity_time(f)))
+        if sf is not None:
+            return sf
+        candidates = self.by_level.get((f.lbuser4, f.lblev), [])
+        if len(candidates) == 1:
+            return candidates[0]
+        print(f'ERROR: No unique field with STASH code {f.lbuser4} and level {f.lblev} '
+              f'valid at {validity_time(f)} found in the source file', file=sys.stderr)
+        sys.exit(1)
+
+def replace_in_ff_from_ff(f, sf, mf_out, replace, sf_in):
+
+    replacement_data = read_field_data(sf, sf_in)
     mf_out.fields.append(replace([f, replacement_data]))
+    return replacement_data
 
-def swap_land_ff(mask_fullpath, ic_file_fullpath, source_fullpath, ic_date):
+def swap_land_ff(mask_fullpath, ic_file_fullpath, source_fullpath, ic_date, pipeline=False, patch=False):
     """
     Function to get the land/surface data from another fields file into the start dump.
 
@@ -37,6 +106,11 @@ def swap_land_ff(mask_fullpath, ic_file_fullpath, source_fullpath, ic_date):
         Path to source fields file to take the land/surface data from
     ic_date : string
         The date-time required in "%Y%m%d%H%M" format
+    pipeline : bool, optional
+        If True, overlap the reads of the source fields with the writing of the output file
+    patch : bool, optional
+        If True, rewrite only the replaced records in a copy of the input file when they fit
+        (not used in pipelined mode)
 
     Returns
     -------
@@ -57,8 +131,10 @@ def swap_land_ff(mask_fullpath, ic_file_fullpath, source_fullpath, ic_date):
     print(ff_in, ff_out)
    
     # Read input file
-    mf_in = mule.load_umfile(ff_in)
-    msf_in = mule.load_umfile(sf_in)
+    with span('load', file=ff_in):
+        mf_in = mule.load_umfile(ff_in)
+    with span('load', file=sf_in):
+        msf_in = mule.load_umfile(sf_in)
    
     # Create Mule Replacement Operator
     replace = ReplaceOperator() 
@@ -66,14 +142,35 @@ def swap_land_ff(mask_fullpath, ic_file_fullpath, source_fullpath, ic_date):
     # Set up the output file
     mf_out = mf_in.copy()
 
+    # Match the fields to replace with the source fields (only the source headers are read)
+    source_index = FieldIndex(msf_in.fields)
+
+    if pipeline:
+        # Read the source fields ahead of the writer (one at a time, as they share a file handle)
+        fp = FieldPipeline(ff_in, 1)
+        source_lock = threading.Lock()
+        def read_source(sf):
+            with source_lock:
+                return read_field_data(sf, sf_in)
+        for index, f in enumerate(mf_in.fields):
+            if f.lbuser4 in LAND_STASH:
+                sf = source_index.find(f)
+                mf_out.fields.append(fp.replace(f, index, fp.read(read_source, sf), None))
+            else:
+                mf_out.fields.append(f)
+        fp.write(mf_out, ff_out)
+        return
+
     # For each field in the input write to the output file (but modify as required)
-    for f,sf in zip(mf_in.fields,msf_in.fields):
+    replacements = []
+    for f in mf_in.fields:
     
-        if f.lbuser4 in [9, 20, 24]:
-            replace_in_ff_from_ff(f, sf, mf_out, replace)
+        if f.lbuser4 in LAND_STASH:
+            sf = source_index.find(f)
+            with span('read', stash=f.lbuser4, level=f.lblev):
+                replacements.append((f, replace_in_ff_from_ff(f, sf, mf_out, replace, sf_in)))
         else:
             mf_out.fields.append(f)
    
     # Write output file
-    mf_out.validate = lambda *args, **kwargs: True
-    mf_out.to_file(ff_out)
+    write_fields(mf_in, mf_out, ff_in, ff_out, replacements, patch)
@@ -0,0 +1,250 @@
+# Copyright 2024 ACCESS-NRI (https://www.access-nri.org.au/)
+# See the top-level COPYRIGHT.txt file for details.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Local server running the hres_ic and hres_eccb jobs of a suite in a single
+long-running process, so that the libraries are imported once and the bounding
+boxes and the archive files opened by a job are reused by the next ones.
+
+The server listens on a Unix socket, started with:
+    hres_server --socket <path>
+
+hres_ic and hres_eccb submit their job to the server when the
+REPLACE_LANDSURFACE_SERVER environment variable gives the path to its socket
+(and run the job themselves if the server cannot be reached). Each job runs
+with the arguments, working directory and environment (ROSE_DATA, cache
+settings, ...) of the client, and its output is sent back to the client.
+Jobs are run one at a time, in their order of arrival.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+# Environment variable with the path to the socket of the server (jobs are run locally if unset or empty)
+SERVER_ENV = 'REPLACE_LANDSURFACE_SERVER'
+
+# Commands run by the server
+COMMANDS = ('hres_ic', 'hres_eccb')
+
+# Modules configured from the environment of each job
+BACKENDS = ('replace_landsurface.replace_landsurface_with_ERA5land_IC', 'replace_landsurface.replace_landsurface_with_BARRA2R_IC')
+
+
+def submit(command, argv):
+    """
+    Function to run a job on the server, if one is configured.
+
+    Parameters
+    ----------
+    command : string
+        The name of the command (hres_ic or hres_eccb)
+    argv : list of string
+        The command-line arguments of the job
+
+    Returns
+    -------
+    int or None
+        The exit status of the job, or None if there is no server to run it
+        (the job is then to be run by the caller).
+    """
+    socket_path = os.environ.get(SERVER_ENV, "")
+    if not socket_path:
+        return None
+    job = {'command': command, 'argv': list(argv), 'cwd': os.getcwd(), 'env': dict(os.environ)}
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(socket_path)
+    except OSError as e:
+        print(f'WARNING: Cannot connect to the server at {socket_path} ({e}), running the job locally', file=sys.stderr)
+        return None
+    with conn, conn.makefile('rw') as stream:
+        stream.write(json.dumps(job) + '\n')
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if 'exit' in message:
+                return message['exit']
+            output = sys.stdout if 'stdout' in message else sys.stderr
+            output.write(message.get('stdout', message.get('stderr')))
+            output.flush()
+    print(f'ERROR: Connection to the server at {socket_path} lost before the end of the job', file=sys.stderr)
+    return 1
+
+
+class _MessageWriter():
+    """ Container class to send the output written to a stream to the client, as JSON lines."""
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+    def write(self, text):
+        if text:
+            self.stream.write(json.dumps({self.name: text}) + '\n')
+        return len(text)
+    def flush(self):
+        self.stream.flush()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """ Handler running a job submitted to the server."""
+    def handle(self):
+        stream = self.connection.makefile('w')
+        job = json.loads(self.rfile.readline())
+        try:
+            with redirect_stdout(_MessageWriter(stream, 'stdout')), redirect_stderr(_MessageWriter(stream, 'stderr')):
+                status = run_job(job['command'], job['argv'], job['cwd'], job['env'])
+            stream.write(json.dumps({'exit': status}) + '\n')
+            stream.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"WARNING: Client of the job {job['command']} {' '.join(job['argv'])} disconnected", file=sys.stderr)
+
+
+def _reset_modules():
+    """
+    Prepare the modules already imported by earlier jobs for a new job (modules imported later are set up on import).
+    """
+    for name in BACKENDS:
+        module = sys.modules.get(name)
+        if module is not None:
+            module.configure()
+    # The archive directories and the mask may have changed since the previous job
+    # (the bounding boxes are cached by file signature, and stay valid)
+    datasets = sys.modules.get('replace_landsurface.datasets')
+    if datasets is not None:
+        datasets.find_archive_files.cache_clear()
+    mask = sys.modules.get('replace_landsurface.mask')
+    if mask is not None:
+        mask.land_points.cache_clear()
+
+
+def run_job(command, argv, cwd, env):
+    """
+    Function to run a job in the server process.
+
+    Parameters
+    ----------
+    command : string
+        The name of the command (hres_ic or hres_eccb)
+    argv : list of string
+        The command-line arguments of the job
+    cwd : string
+        The working directory of the job
+    env : dict
+        The environment variables of the job
+
+    Returns
+    -------
+    int
+        The exit status of the job
+    """
+    from replace_landsurface import hres_eccb, hres_ic
+
+    if command not in COMMANDS:
+        print(f'ERROR: Unknown command {command}', file=sys.stderr)
+        return 1
+    main = {'hres_ic': hres_ic.main, 'hres_eccb': hres_eccb.main}[command]
+
+    saved_env, saved_cwd, saved_argv = dict(os.environ), os.getcwd(), sys.argv
+    try:
+        # Run the job with its own environment (but never submit it to a server again)
+        os.environ.clear()
+        os.environ.update(env)
+        os.environ.pop(SERVER_ENV, None)
+        os.chdir(cwd)
+        sys.argv = [command] + list(argv)
+        _reset_modules()
+        main()
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+        sys.argv = saved_argv
+
+
+def serve(socket_path):
+    """
+    Function to run the server until interrupted.
+
+    Parameters
+    ----------
+    socket_path : string
+        The path to the Unix socket to listen on (only accessible to the user running the server)
+
+    Returns
+    -------
+    None.
+    """
+    from replace_landsurface.datasets import shared_datasets
+
+    # Import the libraries once for all the jobs
+    from replace_landsurface import (  # noqa: F401
+        hres_eccb,
+        hres_ic,
+        replace_landsurface_with_BARRA2R_IC,
+        replace_landsurface_with_ERA5land_IC,
+        replace_landsurface_with_FF_IC,
+    )
+    try:
+        import iris  # noqa: F401
+    except ImportError:
+        pass
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, _JobHandler)
+    finally:
+        os.umask(umask)
+    print(f'Serving hres_ic and hres_eccb jobs on {socket_path}')
+    # Clean up (close the datasets and remove the socket) when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        with server, shared_datasets():
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.remove(socket_path)
+
+
+def main():
+    """
+    Run the server for the hres_ic and hres_eccb jobs.
+
+    Parameters
+    ----------
+    None.  The arguments are given via the command-line
+
+    Returns
+    -------
+    None.
+    """
+    parser = argparse.ArgumentParser(description="Run the hres_ic and hres_eccb jobs in a single long-running process.")
+    parser.add_argument('--socket', default=os.environ.get(SERVER_ENV, ""),
+                        help=f'Path to the Unix socket to listen on (default: ${SERVER_ENV})')
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error(f"--socket or ${SERVER_ENV} is required")
+    serve(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+# UM real missing data indicator
+RMDI = -1073741824.0
+
+
+@pytest.fixture
+def um_file(tmp_path):
+    """
+    A small UM fields file holding a surface temperature field, 2 levels of soil moisture and
+    2 levels of an atmospheric field (unpacked, on a 4x5 lat/lon grid).
+    """
+    mule = pytest.importorskip("mule")
+
+    nrows, npts = 4, 5
+    ff = mule.FieldsFile()
+    ff.fixed_length_header = mule.FixedLengthHeader.empty()
+    flh = ff.fixed_length_header
+    flh.data_set_format_version = 20
+    flh.sub_model = 1
+    flh.vert_coord_type = 1
+    flh.horiz_grid_type = 3
+    flh.dataset_type = 3
+    flh.grid_staggering = 6
+    ff.integer_constants = mule.ff.FF_IntegerConstants.empty()
+    ff.integer_constants.num_cols = npts
+    ff.integer_constants.num_rows = nrows
+    ff.integer_constants.num_p_levels = 2
+    ff.integer_constants.num_wet_levels = 2
+    ff.integer_constants.num_soil_levels = 2
+    ff.real_constants = mule.ff.FF_RealConstants.empty()
+    ff.real_constants.col_spacing = 1.
+    ff.real_constants.row_spacing = 1.
+    ff.real_constants.start_lat = 0.
+    ff.real_constants.start_lon = 0.
+    ff.real_constants.north_pole_lat = 90.
+    ff.real_constants.north_pole_lon = 0.
+    ff.level_dependent_constants = mule.ff.FF_LevelDependentConstants.empty(3)
+    for n, (lbuser4, lblev) in enumerate(((24, 9999), (9, 1), (9, 2), (33, 1), (33, 2))):
+        field = mule.Field3.empty()
+        field.lbyr, field.lbmon, field.lbdat = 2022, 2, 1
+        field.lbyrd, field.lbmond, field.lbdatd = 2022, 2, 1
+        field.lbhr = field.lbmin = field.lbhrd = field.lbmind = 0
+        field.lbtim = 11
+        field.lbft = 0
+        field.lbcode = 1
+        field.lbhem = 3
+        field.lbrow = nrows
+        field.lbnpt = npts
+        field.lbext = 0
+        field.lbpack = 0
+        field.lbrel = 3
+        field.lbvc = 129 if lblev == 9999 else 6
+        field.lblev = lblev
+        field.lbproc = 0
+        field.lbuser1 = 1
+        field.lbuser4 = lbuser4
+        field.lbuser7 = 1
+        field.bplat = 90.
+        field.bplon = 0.
+        field.bgor = 0.
+        field.bzy = field.bzx = -1.
+        field.bdy = field.bdx = 1.
+        field.bmdi = RMDI
+        field.bmks = 1.0
+        field.set_data_provider(mule.ArrayDataProvider(np.arange(nrows * npts, dtype='f8').reshape(nrows, npts) + 100 * n))
+        ff.fields.append(field)
+
+    path = tmp_path / "um_file"
+    ff.validate = lambda *args, **kwargs: True
+    ff.to_file(path.as_posix())
+    return path.as_posix()
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+from replace_landsurface import cache
+from replace_landsurface.cache import grid_definition, load_box, load_subset, save_box, save_subset
+from replace_landsurface.grid import GridBox
+
+
+@pytest.fixture(autouse=True)
+def clear_memory_cache():
+    cache._boxes.clear()
+
+
+def test_box_cache(tmp_path):
+    mask = tmp_path / "mask"
+    mask.write_bytes(b"mask")
+    cache_dir = (tmp_path / "cache").as_posix()
+    grid = grid_definition(np.arange(100.), np.arange(-40., 10., 0.5))
+    box = GridBox(10, 20, 30, 40)
+    assert load_box(cache_dir, "/archive", grid, mask.as_posix(), "land_binary_mask") is None
+    save_box(cache_dir, "/archive", grid, mask.as_posix(), "land_binary_mask", box)
+    cache._boxes.clear()
+    assert load_box(cache_dir, "/archive", grid, mask.as_posix(), "land_binary_mask") == box
+    # Different source archive, regridded archive or modified mask
+    assert load_box(cache_dir, "/other", grid, mask.as_posix(), "land_binary_mask") is None
+    regridded = grid_definition(np.arange(100.), np.arange(-40., 10., 0.25))
+    assert load_box(cache_dir, "/archive", regridded, mask.as_posix(), "land_binary_mask") is None
+    os.utime(mask, ns=(0, 0))
+    assert load_box(cache_dir, "/archive", grid, mask.as_posix(), "land_binary_mask") is None
+
+
+def test_box_cache_memory_only(tmp_path):
+    mask = tmp_path / "mask"
+    mask.write_bytes(b"mask")
+    box = GridBox(1, 2, 3, 4)
+    grid = grid_definition(np.arange(10.), np.arange(10.))
+    save_box("", "/archive", grid, mask.as_posix(), "land_binary_mask", box)
+    assert load_box("", "/archive", grid, mask.as_posix(), "land_binary_mask") == box
+    cache._boxes.clear()
+    assert load_box("", "/archive", grid, mask.as_posix(), "land_binary_mask") is None
+
+
+def test_subset_cache_eviction(tmp_path):
+    cache_dir = (tmp_path / "cache").as_posix()
+    times = np.array(["2022-02-01T00", "2022-02-01T06"], dtype="datetime64[ns]")
+    data = np.zeros((2, 16, 16))
+    sources = []
+    for n in range(3):
+        source = tmp_path / f"source{n}.nc"
+        source.write_bytes(b"nc")
+        sources.append(source.as_posix())
+        # Room for two subsets only
+        save_subset(cache_dir, sources[-1], "skt", GridBox(0, 15, 0, 15), times, data, 2 * data.nbytes + 2048)
+        # Order the entries by last use
+        _, digest = cache._subset_key(sources[-1], "skt", GridBox(0, 15, 0, 15))
+        os.utime(cache._subset_entry_paths(cache_dir, digest)[0], ns=(n, n))
+    box = GridBox(0, 15, 0, 15)
+    assert load_subset(cache_dir, sources[0], "skt", box) is None
+    cached_times, cached_data = load_subset(cache_dir, sources[2], "skt", box)
+    np.testing.assert_array_equal(cached_times, times)
+    np.testing.assert_array_equal(cached_data, data)
+    assert load_subset(cache_dir, sources[2], "tsl", box) is None
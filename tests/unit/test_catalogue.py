@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from replace_landsurface.catalogue import BARRA_R2, ERA5_LAND, build_catalogue, lookup, write_catalogue
+
+
+def write_file(path, times):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    xr.Dataset({"v": (("time",), np.zeros(len(times)))}, coords={"time": times}).to_netcdf(path)
+    return path
+
+
+def test_catalogue(tmp_path):
+    era_dir = tmp_path / "era5_land"
+    barra_dir = tmp_path / "barra_r2"
+    feb = write_file(era_dir / "swvl1" / "2022" / "swvl1_20220201.nc", pd.date_range("2022-02-01", "2022-02-28T23", freq="h"))
+    mar = write_file(era_dir / "swvl1" / "2022" / "swvl1_20220301.nc", pd.date_range("2022-03-01", "2022-03-31T23", freq="h"))
+    tsl = write_file(barra_dir / "3hr" / "tsl" / "latest" / "tsl_202202.nc",
+                     pd.DatetimeIndex(["2022-02-01T00", "2022-02-01T03", "2022-02-01T09"]))
+    fname = (tmp_path / "catalogue.json").as_posix()
+    catalogue = build_catalogue(era_dir.as_posix(), barra_dir.as_posix())
+    assert len(catalogue["files"]) == 3
+    write_catalogue(catalogue, fname)
+
+    assert lookup(ERA5_LAND, era_dir, "swvl1", "202202260600", fname=fname) == (os.path.realpath(feb), 25 * 24 + 6)
+    assert lookup(ERA5_LAND, era_dir, "swvl1", "202203010000", fname=fname) == (os.path.realpath(mar), 0)
+    assert lookup(ERA5_LAND, era_dir, "swvl1", "202204010000", fname=fname) is None
+    assert lookup(ERA5_LAND, era_dir, "swvl2", "202202260600", fname=fname) is None
+    # Irregular time axis
+    assert lookup(BARRA_R2, barra_dir, "tsl", "202202010900", "3hr", fname=fname) == (os.path.realpath(tsl), 2)
+    assert lookup(BARRA_R2, barra_dir, "tsl", "202202010600", "3hr", fname=fname) is None
+    # Catalogue of another archive directory, or no catalogue
+    assert lookup(ERA5_LAND, tmp_path, "swvl1", "202202260600", fname=fname) is None
+    assert lookup(ERA5_LAND, era_dir, "swvl1", "202202260600", fname="") is None
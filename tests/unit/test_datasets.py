@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from replace_landsurface import datasets as datasets_module
+from replace_landsurface.cache import load_subset
+from replace_landsurface.datasets import (
+    DatasetCache,
+    chunk_bytes,
+    find_time_index,
+    read_cached_subset,
+    run_datasets,
+    shared_datasets,
+)
+from replace_landsurface.grid import GridBox
+
+
+@pytest.fixture
+def nc_file(tmp_path):
+    times = pd.date_range("2022-02-01", periods=48, freq="h")
+    ds = xr.Dataset(
+        {"skt": (("time", "latitude", "longitude"), np.zeros((48, 2, 3)))},
+        coords={"time": times},
+    )
+    path = tmp_path / "skt.nc"
+    ds.to_netcdf(path)
+    return path.as_posix()
+
+
+def test_find_time_index(nc_file):
+    with xr.open_dataset(nc_file) as d:
+        assert find_time_index(d["time"], "202202010000") == 0
+        assert find_time_index(d["time"], "202202020500") == 29
+
+
+def test_find_time_index_missing(nc_file, capsys):
+    with xr.open_dataset(nc_file) as d:
+        with pytest.raises(SystemExit):
+            find_time_index(d["time"], "202203010000", nc_file)
+    assert "202203010000 not found" in capsys.readouterr().err
+
+
+def test_dataset_cache(nc_file):
+    with DatasetCache() as datasets:
+        d = datasets.open(nc_file)
+        assert datasets.open(nc_file) is d
+        assert datasets.time_index(nc_file, "202202011200") == 12
+
+
+def test_dataset_cache_close(tmp_path, monkeypatch):
+    opened = []
+
+    class Handle():
+        closed = False
+        def close(self):
+            self.closed = True
+
+    def open_handle(ncfname, chunked=False):
+        opened.append(Handle())
+        return opened[-1]
+
+    monkeypatch.setattr(datasets_module, "_open_dataset", open_handle)
+    datasets = DatasetCache()
+    a = datasets.open((tmp_path / "a.nc").as_posix())
+    # Same file under another spelling of its path
+    assert datasets.open((tmp_path / "." / "a.nc").as_posix()) is a
+    datasets.open((tmp_path / "b.nc").as_posix())
+    assert len(opened) == 2
+    datasets.close()
+    assert all(handle.closed for handle in opened)
+    # Opened again after closing
+    assert datasets.open((tmp_path / "a.nc").as_posix()) is not a
+
+
+def test_read_cached_subset(tmp_path):
+    times = pd.date_range("2022-02-01", periods=4, freq="6h")
+    data = np.arange(4 * 3 * 5, dtype=np.float32).reshape(4, 3, 5)
+    ds = xr.Dataset({"skt": (("time", "latitude", "longitude"), data)}, coords={"time": times})
+    path = (tmp_path / "skt.nc").as_posix()
+    ds.to_netcdf(path)
+    cache_dir = (tmp_path / "cache").as_posix()
+    # Region wrapping around the longitudes
+    box = GridBox(4, 0, 1, 2)
+    expected = np.concatenate([data[2, 1:3, 4:], data[2, 1:3, :1]], axis=1)
+    for _ in range(2):
+        subset = read_cached_subset(path, "skt", "202202011200", box, cache_dir, 2**20)
+        np.testing.assert_array_equal(subset, expected)
+    assert load_subset(cache_dir, path, "skt", box) is not None
+
+
+def test_chunk_bytes(tmp_path):
+    data = np.arange(4 * 10 * 12, dtype=np.float32).reshape(4, 10, 12)
+    ds = xr.Dataset({"skt": (("time", "latitude", "longitude"), data)})
+    path = (tmp_path / "skt.nc").as_posix()
+    ds.to_netcdf(path, encoding={"skt": {"chunksizes": (1, 5, 5)}})
+    with DatasetCache(chunked=True) as datasets:
+        d = datasets.open(path)
+        index = (2, slice(3, 7), slice(4, 11))
+        np.testing.assert_array_equal(d["skt"][index].values, data[index])
+        # Chunks [0:10) x [0:12) (the last chunk along longitude is partial)
+        assert chunk_bytes(d["skt"], index) == (10 * 12 * 4, 4 * 7 * 4)
+        datasets.record_read(d["skt"], index)
+        assert (datasets.bytes_read, datasets.bytes_used) == (480, 112)
+
+
+def test_shared_datasets(nc_file):
+    with run_datasets() as datasets:
+        datasets.open(nc_file)
+    assert datasets._datasets == {}
+    with shared_datasets():
+        with run_datasets() as first:
+            first.open(nc_file)
+        with run_datasets() as second:
+            assert second is first
+            assert len(second._datasets) == 1
+        with run_datasets(chunked=True) as chunked:
+            assert chunked is not first
+    assert first._datasets == {}
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+
+from replace_landsurface.dates import parse_start
+
+
+@pytest.mark.parametrize("value", ["202202260600", "20220226T0600Z", "2022-02-26T06:00", "2022-02-26 06:00:00"])
+def test_parse_start(value):
+    assert parse_start(value) == datetime(2022, 2, 26, 6)
+
+
+def test_parse_start_pandas():
+    pytest.importorskip("pandas")
+    assert parse_start("26 Feb 2022 06:00") == datetime(2022, 2, 26, 6)
+
+
+@pytest.mark.parametrize("value", ["20220226T06Z", "2022022606"])
+def test_parse_start_short(value):
+    # Not misread as single digit hours/minutes
+    pandas = pytest.importorskip("pandas")
+    try:
+        expected = pandas.to_datetime(value).to_pydatetime()
+    except ValueError:
+        with pytest.raises(ValueError):
+            parse_start(value)
+    else:
+        assert parse_start(value) == expected
+
+
+def test_parse_start_invalid():
+    pytest.importorskip("pandas")
+    with pytest.raises(ValueError):
+        parse_start("not a date")
@@ -0,0 +1,201 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+pytest.importorskip("mule")
+
+from replace_landsurface import datasets as datasets_module
+from replace_landsurface import engine
+from replace_landsurface.datasets import DatasetCache
+from replace_landsurface.grid import GridBox, union_box
+from replace_landsurface.mask import LandPoints
+
+TABLE = [
+    engine.Replacement(9, 1, 'mrsol', '3hr', layer=0, multiplier=100.),
+    engine.Replacement(9, 2, 'mrsol', '3hr', layer=1),
+    engine.Replacement(24, None, 'ts', '1hr'),
+]
+PATTERN = os.path.join('{freq}', '{var}', '{var}_{yyyy}{mm}.nc')
+
+
+def make_field(lbuser4, lblev):
+    return SimpleNamespace(lbuser4=lbuser4, lblev=lblev)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    times = pd.date_range("2022-02-01", periods=4, freq="3h")
+    lats = np.arange(4.)
+    lons = np.arange(5.)
+    for var, freq, dims, shape in (('mrsol', '3hr', ('time', 'depth', 'lat', 'lon'), (4, 2, 4, 5)),
+                                   ('ts', '1hr', ('time', 'lat', 'lon'), (4, 4, 5))):
+        data = np.arange(np.prod(shape), dtype='f4').reshape(shape)
+        ds = xr.Dataset({var: (dims, data)}, coords={'time': times, 'lat': lats, 'lon': lons})
+        path = tmp_path / freq / var / f'{var}_202202.nc'
+        path.parent.mkdir(parents=True)
+        ds.to_netcdf(path)
+    return engine.Archive('test', tmp_path.as_posix(), PATTERN, TABLE, lon='lon', lat='lat')
+
+
+def test_replacement(archive):
+    assert archive.replacement(make_field(9, 2)) is TABLE[1]
+    # Any level
+    assert archive.replacement(make_field(24, 0)) is TABLE[2]
+    assert archive.replacement(make_field(9, 3)) is None
+    assert archive.replacement(make_field(33, 1)) is None
+
+
+def test_read_plan(archive):
+    fields = [make_field(9, 1), make_field(33, 1), make_field(9, 2), make_field(24, 0)]
+    plan = engine.ReadPlan(archive, fields, '202202010300')
+    assert plan.replacements == [TABLE[0], None, TABLE[1], TABLE[2]]
+    # Each file is read once, for all its variables, and only the layers needed are read
+    assert len(plan.reads) == 2
+    assert sorted(plan.reads.values(), key=str) == [{'mrsol': (0, 1)}, {'ts': None}]
+    assert plan.files[('ts', '1hr')].endswith(os.path.join('1hr', 'ts', 'ts_202202.nc'))
+
+
+def test_read_plan_layers(archive):
+    plan = engine.ReadPlan(archive, [make_field(9, 2), make_field(33, 1)], '202202010300')
+    assert list(plan.reads.values()) == [{'mrsol': (1,)}]
+
+
+def test_layer_runs():
+    assert engine.layer_runs((0, 1, 3)) == [slice(0, 2), slice(3, 4)]
+    assert engine.layer_runs((2,)) == [slice(2, 3)]
+
+
+def test_find_file_missing(archive, capsys):
+    with pytest.raises(SystemExit):
+        engine.find_file(archive, 'ts', '1hr', '202203010000')
+    assert 'ERROR: No file matching' in capsys.readouterr().err
+
+
+def test_read_file(archive):
+    plan = engine.ReadPlan(archive, [make_field(9, 1)], '202202010300')
+    ncfname = plan.files[('mrsol', '3hr')]
+    bounds = GridBox(1, 3, 0, 1)
+    data = engine.read_file(ncfname, {'mrsol': (0, 1)}, '202202010300', bounds, archive)
+    with xr.open_dataset(ncfname) as d:
+        full = d['mrsol'][1, :, 0:2, :].values
+    assert sorted(data) == [('mrsol', 0), ('mrsol', 1)]
+    np.testing.assert_array_equal(data['mrsol', 1], full[1, :, 1:4])
+    # Same data through the datasets opened during the run, and with the extent wrapping around the grid
+    with DatasetCache() as datasets:
+        data = engine.read_file(ncfname, {'mrsol': (1,)}, '202202010300', GridBox(3, 0, 0, 1), archive, datasets)
+        # Only the layer needed is read
+        assert datasets.bytes_used == 2 * 3 * 4
+    assert list(data) == [('mrsol', 1)]
+    np.testing.assert_array_equal(data['mrsol', 1], np.concatenate((full[1, :, 3:], full[1, :, :1]), axis=-1))
+
+
+def test_read_file_descending(archive):
+    archive.lat_descending = True
+    plan = engine.ReadPlan(archive, [make_field(24, 0)], '202202010000')
+    data = engine.read_file(plan.files[('ts', '1hr')], {'ts': None}, '202202010000', GridBox(0, 4, 0, 3), archive)
+    np.testing.assert_array_equal(data['ts', None], np.arange(20.).reshape(4, 5)[::-1, :])
+
+
+def test_read_files_workers(archive):
+    fields = [make_field(9, 1), make_field(9, 2), make_field(24, 0)]
+    plan = engine.ReadPlan(archive, fields, '202202010300')
+    # A bounding_box as built from a mask (wrapping around the grid), without reading a mask
+    bounds = engine.bounding_box.__new__(engine.bounding_box)
+    GridBox.__init__(bounds, 3, 1, 1, 3)
+    serial = engine.read_files(plan.reads, '202202010300', bounds, archive, workers=1)
+    # Files read in separate processes (the archive and the bounding box are sent to the workers),
+    # with a given number of processes and by default
+    for workers in (2, None):
+        parallel = engine.read_files(plan.reads, '202202010300', bounds, archive, workers=workers)
+        assert list(parallel) == list(serial)
+        for ncfname, data in serial.items():
+            assert list(parallel[ncfname]) == list(data)
+            for key, values in data.items():
+                np.testing.assert_array_equal(parallel[ncfname][key], values)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_read_files_chunked(archive, capsys, monkeypatch, workers):
+    fields = [make_field(9, 1), make_field(9, 2), make_field(24, 0)]
+    plan = engine.ReadPlan(archive, fields, '202202010300')
+    bounds = engine.bounding_box.__new__(engine.bounding_box)
+    GridBox.__init__(bounds, 1, 3, 0, 1)
+    with DatasetCache() as datasets:
+        serial = engine.read_files(plan.reads, '202202010300', bounds, archive, datasets, workers=1)
+        expected = (datasets.bytes_read, datasets.bytes_used)
+    capsys.readouterr()
+    opened = []
+    open_dataset = datasets_module._open_dataset
+    monkeypatch.setattr(datasets_module, "_open_dataset",
+                        lambda ncfname, chunked=False: opened.append(chunked) or open_dataset(ncfname, chunked))
+    # The files are read by chunks (also in the worker processes), and the bytes read are reported
+    with DatasetCache(chunked=True) as datasets:
+        data = engine.read_files(plan.reads, '202202010300', bounds, archive, datasets, workers=workers)
+        assert (datasets.bytes_read, datasets.bytes_used) == expected
+    if workers is None:
+        # Each file opened once, through the datasets of the run
+        assert opened == [True] * len(plan.reads)
+    assert 'Archive reads:' in capsys.readouterr().out
+    for ncfname, values in serial.items():
+        for key, value in values.items():
+            np.testing.assert_array_equal(data[ncfname][key], value)
+
+
+def test_read_workers(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    assert engine.read_workers(None, 2) == 2
+    assert engine.read_workers(None, 8) == 4
+    assert engine.read_workers(1, 8) == 1
+
+
+@pytest.mark.parametrize("lat_descending", [False, True])
+def test_read_tile(archive, lat_descending):
+    archive.lat_descending = lat_descending
+    plan = engine.ReadPlan(archive, [make_field(9, 2)], '202202010300')
+    ncfname = plan.files[('mrsol', '3hr')]
+    bounds = GridBox(3, 1, 0, 3)
+    whole = engine.read_file(ncfname, {'mrsol': (1,)}, '202202010300', bounds, archive)['mrsol', 1]
+    tiles = [engine.read_tile(ncfname, 'mrsol', 1, '202202010300', bounds, archive, start, start + 2) for start in (0, 2)]
+    np.testing.assert_array_equal(np.concatenate(tiles), whole)
+
+
+@pytest.mark.parametrize("land_only", [False, True])
+def test_stream_field(archive, land_only):
+    ncfname = engine.ReadPlan(archive, [make_field(9, 1)], '202202010300').files[('mrsol', '3hr')]
+    bounds = GridBox(0, 4, 0, 3)
+    current = np.arange(20.).reshape(4, 5)
+    f = SimpleNamespace(lbuser4=9, lblev=1, lbpack=1, lbuser1=1, get_data=lambda: current)
+    points = LandPoints(np.arange(20).reshape(4, 5) % 3 == 0) if land_only else None
+    data = engine.read_file(ncfname, {'mrsol': (0,)}, '202202010300', bounds, archive)['mrsol', 0]
+    expected = engine.merge_field(current, data, TABLE[0], points)
+    # Whole layer, and tiles of a single row
+    for max_memory in (2**20, 1):
+        merged = engine.stream_field(f, 'astart', ncfname, TABLE[0], '202202010300', bounds, archive, max_memory, points=points)
+        np.testing.assert_array_equal(merged, expected)
+
+
+@pytest.mark.parametrize("lat_descending", [False, True])
+def test_slice_box(archive, lat_descending):
+    archive.lat_descending = lat_descending
+    ncfname = engine.ReadPlan(archive, [make_field(9, 1)], '202202010300').files[('mrsol', '3hr')]
+    boxes = [GridBox(0, 2, 0, 1), GridBox(1, 4, 1, 3)]
+    union = union_box(boxes)
+    union_data = engine.read_file(ncfname, {'mrsol': (0, 1)}, '202202010300', union, archive)
+    for box in boxes:
+        data = engine.read_file(ncfname, {'mrsol': (0, 1)}, '202202010300', box, archive)
+        for key, values in data.items():
+            np.testing.assert_array_equal(engine.slice_box(union_data[key], box, union, archive), values)
+
+
+def test_merge_field():
+    current = np.zeros((2, 3))
+    data = np.full((2, 3), 0.1)
+    data[0, 0] = np.nan
+    merged = engine.merge_field(current, data, TABLE[0])
+    np.testing.assert_allclose(merged[0, 1:], 10.)
+    assert merged[0, 0] == 0.
+    np.testing.assert_allclose(engine.merge_field(current, data, TABLE[1])[1], 0.1)
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("mule")
+
+from replace_landsurface.replace_landsurface_with_FF_IC import FieldIndex
+
+
+def make_field(lbuser4, lblev, lbhr=0):
+    return SimpleNamespace(lbuser4=lbuser4, lblev=lblev, lbyr=2022, lbmon=2, lbdat=26, lbhr=lbhr, lbmin=0)
+
+
+def test_field_index():
+    source = [make_field(24, 0, 6), make_field(9, 2), make_field(9, 1), make_field(33, 0)]
+    index = FieldIndex(source)
+    # Matched whatever the order of the fields
+    assert index.find(make_field(9, 1)) is source[2]
+    assert index.find(make_field(9, 2)) is source[1]
+    # Unique field with a different validity time
+    assert index.find(make_field(24, 0)) is source[0]
+
+
+def test_field_index_missing():
+    index = FieldIndex([make_field(9, 1, 0), make_field(9, 1, 6)])
+    with pytest.raises(SystemExit):
+        index.find(make_field(9, 1, 12))
+    with pytest.raises(SystemExit):
+        index.find(make_field(20, 1))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from replace_landsurface.grid import GridBox, box_indices, coord_index, union_box
+
+# ERA5-land-like (0.1 degree, latitudes descending) and BARRA-R2-like grids
+ERA_LONS = np.round(np.arange(-180, 180, 0.1), 1)
+ERA_LATS = np.round(np.arange(90, -90.05, -0.1), 1)
+BARRA_LONS = 88.48 + 0.11 * np.arange(1082)
+BARRA_LATS = -57.97 + 0.11 * np.arange(658)
+
+
+def argwhere_index(coords, value):
+    # Original implementation
+    adj = (coords[1] - coords[0]) / 2.0
+    return np.argwhere((coords > value - adj) & (coords < value + adj))[0][0]
+
+
+@pytest.mark.parametrize("coords", [ERA_LONS, BARRA_LONS, BARRA_LATS])
+def test_coord_index_matches_argwhere(coords):
+    rng = np.random.default_rng(0)
+    step = coords[1] - coords[0]
+    for value in rng.uniform(coords.min(), coords.max(), 200):
+        value = coords[argwhere_index(coords, value)] + step * rng.uniform(-0.4, 0.4)
+        assert coord_index(coords, value) == argwhere_index(coords, value)
+
+
+def test_coord_index_descending():
+    assert coord_index(ERA_LATS, -12.3) == np.argmin(np.abs(ERA_LATS + 12.3))
+
+
+def test_coord_index_irregular():
+    coords = np.array([0.0, 1.0, 3.0, 6.0, 10.0])
+    assert coord_index(coords, 6.2) == 3
+    assert coord_index(coords[::-1], 6.2) == 1
+
+
+def test_coord_index_missing():
+    with pytest.raises(ValueError):
+        coord_index(BARRA_LONS, 10.0)
+
+
+def test_box_indices():
+    box = GridBox(*box_indices(ERA_LONS, ERA_LATS, 140.0, 150.0, -40.0, -30.0))
+    assert ERA_LATS[box.lat_slice][[0, -1]].tolist() == [-30.0, -40.0]
+    assert not box.wraps
+    assert ERA_LONS[box.lon_slices[0]][[0, -1]].tolist() == [140.0, 150.0]
+
+
+def test_box_wraps():
+    box = GridBox(*box_indices(ERA_LONS, ERA_LATS, 170.0, -170.0, -10.0, 10.0))
+    assert box.wraps
+    lons = np.concatenate([ERA_LONS[s] for s in box.lon_slices])
+    assert lons.size == 201
+
+
+def test_box_serialization():
+    box = GridBox(1, 2, 3, 4)
+    assert GridBox.from_dict(box.to_dict()) == box
+
+
+def test_union_box():
+    assert union_box([GridBox(2, 5, 10, 20), GridBox(4, 8, 12, 15)]) == GridBox(2, 8, 10, 20)
+    # No union if an extent wraps around the grid
+    assert union_box([GridBox(2, 5, 10, 20), GridBox(350, 3, 12, 15)]) is None
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ('iris', 'mule', 'numpy', 'pandas', 'xarray')
+
+
+def imported_modules(*modules):
+    """ Heavy modules imported (in a fresh interpreter) by importing the given modules."""
+    code = (f"import sys; import {', '.join(modules)}; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_cli_imports():
+    assert imported_modules('replace_landsurface.hres_ic', 'replace_landsurface.hres_eccb') == set()
+
+
+def test_ff_imports():
+    pytest.importorskip('mule')
+    assert imported_modules('replace_landsurface.replace_landsurface_with_FF_IC') <= {'mule', 'numpy'}
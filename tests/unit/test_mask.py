@@ -0,0 +1,38 @@
+import numpy as np
+import xarray as xr
+
+from replace_landsurface.mask import land_points, read_mask_extent
+
+
+def test_read_mask_extent_netcdf(tmp_path):
+    lats = np.linspace(-40.0, -30.0, 11)
+    lons = np.linspace(140.0, 155.0, 16)
+    ds = xr.Dataset(
+        {"land_binary_mask": (("latitude", "longitude"), np.ones((11, 16), dtype="i1"))},
+        coords={"latitude": lats, "longitude": lons},
+    )
+    ds["latitude"].attrs["standard_name"] = "latitude"
+    ds["longitude"].attrs["standard_name"] = "longitude"
+    path = tmp_path / "mask.nc"
+    ds.to_netcdf(path)
+    assert read_mask_extent(path.as_posix(), "land_binary_mask") == (140.0, 155.0, -40.0, -30.0)
+
+
+def test_land_points_netcdf(tmp_path):
+    # Latitudes north to south in the file
+    lats = np.linspace(-30.0, -40.0, 3)
+    lons = np.linspace(140.0, 143.0, 4)
+    land = np.array([[0, 0, 1, 1], [0, 1, 1, 0], [0, 0, 0, 0]], dtype="i1")
+    ds = xr.Dataset(
+        {"land_binary_mask": (("latitude", "longitude"), land)},
+        coords={"latitude": lats, "longitude": lons},
+    )
+    ds["latitude"].attrs["standard_name"] = "latitude"
+    path = tmp_path / "mask.nc"
+    ds.to_netcdf(path)
+    points = land_points(path.as_posix(), "land_binary_mask")
+    assert points.shape == (3, 4)
+    # South to north, as in the UM files
+    np.testing.assert_array_equal(points.rows, [1, 1, 2, 2])
+    np.testing.assert_array_equal(points.cols, [1, 2, 2, 3])
+    assert points.fraction == 4 / 12
@@ -0,0 +1,30 @@
+import argparse
+
+import pytest
+
+from replace_landsurface.memory import parse_size, peak_rss, tile_rows
+
+
+def test_parse_size():
+    assert parse_size('1024') == 1024
+    assert parse_size('512M') == 512 * 2**20
+    assert parse_size('1.5GB') == 3 * 2**29
+    assert parse_size('2g') == 2 * 2**30
+    for value in ('', 'M', 'lots', '0', '-1G'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_size(value)
+
+
+def test_peak_rss():
+    before = peak_rss()
+    data = bytearray(64 * 2**20)
+    assert before > 0
+    assert peak_rss() >= len(data)
+
+
+def test_tile_rows():
+    # Whole field if it fits
+    assert tile_rows(100, 800, 2**20) == 100
+    assert tile_rows(100, 800, 8000) == 10
+    # At least one row
+    assert tile_rows(100, 800, 10) == 1
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from replace_landsurface.mask import LandPoints
+from replace_landsurface.merge import merge_data, merge_points
+
+
+@pytest.mark.parametrize("multiplier", [None, 250., 2000.])
+def test_merge_data(multiplier):
+    rng = np.random.default_rng(0)
+    current_data = rng.random((5, 7))
+    data = rng.random((5, 7)).astype(np.float32)
+    data[data > 0.7] = np.nan
+    scaled = data if multiplier is None else data * multiplier
+    expected = np.where(np.isnan(scaled), current_data, scaled)
+    merged = merge_data(current_data, data, multiplier)
+    assert merged.dtype == expected.dtype
+    assert merged.tobytes() == expected.tobytes()
+    # Big-endian (mapped) current data
+    merged = merge_data(current_data.astype('>f8'), data, multiplier)
+    assert merged.tobytes() == expected.tobytes()
+
+
+def test_merge_data_in_place():
+    current_data = np.zeros((2, 2))
+    data = np.array([[1., np.nan], [np.nan, 4.]])
+    merged = merge_data(current_data, data, out=current_data)
+    assert merged is current_data
+    np.testing.assert_array_equal(current_data, [[1., 0.], [0., 4.]])
+
+
+@pytest.mark.parametrize("multiplier", [None, 250.])
+def test_merge_points(multiplier):
+    rng = np.random.default_rng(0)
+    current_data = rng.random((5, 7))
+    data = rng.random((5, 7)).astype(np.float32)
+    data[0, :] = np.nan
+    land = rng.random((5, 7)) > 0.5
+    merged = merge_points(current_data, data, LandPoints(land), multiplier)
+    expected = merge_data(current_data, data, multiplier)
+    np.testing.assert_array_equal(merged[land], expected[land])
+    np.testing.assert_array_equal(merged[~land], current_data[~land])
+    with pytest.raises(ValueError):
+        merge_points(current_data[1:], data[1:], LandPoints(land), multiplier)
+
+
+def test_merge_points_tiles():
+    rng = np.random.default_rng(0)
+    current_data = rng.random((5, 7))
+    data = rng.random((5, 7))
+    points = LandPoints(rng.random((5, 7)) > 0.5)
+    out = np.empty_like(current_data)
+    for start in (0, 2, 4):
+        stop = min(start + 2, 5)
+        merge_points(current_data[start:stop], data[start:stop], points.tile(start, stop), out=out[start:stop])
+    np.testing.assert_array_equal(out, merge_points(current_data, data, points))
@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from replace_landsurface import patch
+from replace_landsurface.patch import DATA_DIM1, LBEGIN, LBLREC, LBNREC, passthrough_fields, patch_fields, write_fields
+from replace_landsurface.records import read_field_data
+
+LOOKUP_START = 11
+LOOKUP_DIM1 = 64
+
+
+def make_file(path, nrows=2, npts=3, lbnrec=8):
+    """
+    Write a minimal UM-like file with two unpacked fields, returning the mule-like objects describing it.
+    """
+    size = nrows * npts
+    # Records are consecutive (padded to lbnrec words if given)
+    lbegins = [200, 200 + max(lbnrec, size)]
+    lookup = np.zeros((2, LOOKUP_DIM1), dtype='>i8')
+    lookup[:, LBEGIN] = lbegins
+    lookup[:, LBLREC] = size
+    lookup[:, LBNREC] = lbnrec
+    words = np.zeros(lbegins[1] + max(lbnrec, size), dtype='>f8')
+    words.view('>i8')[LOOKUP_START-1:LOOKUP_START-1+lookup.size] = lookup.ravel()
+    fields = []
+    for n, lbegin in enumerate(lbegins):
+        words[lbegin:lbegin+size] = n + 1
+        fields.append(SimpleNamespace(lbpack=0, lbuser1=1, lbrow=nrows, lbnpt=npts,
+                                      lbegin=lbegin, lblrec=size, lbnrec=lbnrec))
+    words.tofile(path)
+    flh = SimpleNamespace(lookup_start=LOOKUP_START, lookup_dim1=LOOKUP_DIM1, lookup_dim2=2, data_start=lbegins[0]+1)
+    return SimpleNamespace(fixed_length_header=flh, fields=fields)
+
+
+def test_patch_fields(tmp_path):
+    ff_in, ff_out = tmp_path / "in", tmp_path / "out"
+    mf_in = make_file(ff_in)
+    data = np.arange(6.).reshape(2, 3)
+    assert patch_fields(mf_in, ff_in, ff_out, [(mf_in.fields[1], data)])
+    words_in = np.fromfile(ff_in, dtype='>f8')
+    words_out = np.fromfile(ff_out, dtype='>f8')
+    np.testing.assert_array_equal(words_out[208:214], data.ravel())
+    # Everything else is unchanged
+    words_out[208:214] = words_in[208:214]
+    np.testing.assert_array_equal(words_out.view('>i8'), words_in.view('>i8'))
+
+
+def test_patch_fields_unsupported(tmp_path):
+    ff_in, ff_out = tmp_path / "in", tmp_path / "out"
+    mf_in = make_file(ff_in, lbnrec=6)
+    # Land packed field
+    mf_in.fields[0].lbpack = 120
+    assert not patch_fields(mf_in, ff_in, ff_out, [(mf_in.fields[0], np.zeros((2, 3)))])
+    # Record larger than the space allocated on disk
+    mf_in.fields[1].lbnrec = 4
+    assert not patch_fields(mf_in, ff_in, ff_out, [(mf_in.fields[1], np.zeros((2, 3)))])
+    assert not ff_out.exists()
+
+
+def test_passthrough_fields(tmp_path, monkeypatch):
+    ff_in, ff_out = tmp_path / "in", tmp_path / "out"
+    mf_in = make_file(ff_in, lbnrec=0)
+    # A replaced record longer than the original one moves the following records
+    payload = np.arange(10.).astype('>f8').tobytes()
+    monkeypatch.setattr(patch, '_pack_data', lambda f, data: payload)
+    assert passthrough_fields(mf_in, ff_in, ff_out, [(mf_in.fields[0], None)])
+    words_in = np.fromfile(ff_in, dtype='>f8')
+    words_out = np.fromfile(ff_out, dtype='>f8')
+    lookup_out = words_out.view('>i8')[LOOKUP_START-1:LOOKUP_START-1+2*LOOKUP_DIM1].reshape(2, LOOKUP_DIM1)
+    np.testing.assert_array_equal(lookup_out[:, LBEGIN], [200, 210])
+    np.testing.assert_array_equal(lookup_out[:, LBLREC], [10, 6])
+    np.testing.assert_array_equal(lookup_out[:, LBNREC], [0, 0])
+    assert words_out.view('>i8')[DATA_DIM1] == 16
+    np.testing.assert_array_equal(words_out[200:210], np.arange(10.))
+    np.testing.assert_array_equal(words_out[210:216], words_in[206:212])
+    assert words_out.size == 216
+
+
+def test_passthrough_fields_padded(tmp_path, monkeypatch):
+    ff_in, ff_out = tmp_path / "in", tmp_path / "out"
+    # Records padded to sectors of 8 words
+    mf_in = make_file(ff_in)
+    payload = np.arange(10.).astype('>f8').tobytes()
+    monkeypatch.setattr(patch, '_pack_data', lambda f, data: payload)
+    assert passthrough_fields(mf_in, ff_in, ff_out, [(mf_in.fields[0], None)])
+    words_in = np.fromfile(ff_in, dtype='>f8')
+    words_out = np.fromfile(ff_out, dtype='>f8')
+    lookup_out = words_out.view('>i8')[LOOKUP_START-1:LOOKUP_START-1+2*LOOKUP_DIM1].reshape(2, LOOKUP_DIM1)
+    # The replaced record takes 2 sectors, as laid out in the input file
+    np.testing.assert_array_equal(lookup_out[:, LBEGIN], [200, 216])
+    np.testing.assert_array_equal(lookup_out[:, LBLREC], [10, 6])
+    np.testing.assert_array_equal(lookup_out[:, LBNREC], [16, 8])
+    assert words_out.view('>i8')[DATA_DIM1] == 24
+    np.testing.assert_array_equal(words_out[200:210], np.arange(10.))
+    np.testing.assert_array_equal(words_out[216:224], words_in[208:216])
+    assert words_out.size == 224
+
+
+def validation_error(mule, path):
+    """ The error raised by mule when validating a UM file (None if valid)."""
+    try:
+        mule.load_umfile(path).validate()
+    except Exception as err:
+        return str(err)
+    return None
+
+
+def test_write_fields_passthrough(um_file, tmp_path, capsys):
+    mule = pytest.importorskip("mule")
+    from replace_landsurface.engine import ReplaceOperator
+
+    mf_in = mule.load_umfile(um_file)
+    replacements = [(f, read_field_data(f, um_file) * 2.) for f in mf_in.fields if f.lbuser4 == 9]
+    data = {id(f): values for f, values in replacements}
+    mf_out = mf_in.copy()
+    for f in mf_in.fields:
+        mf_out.fields.append(ReplaceOperator()([f, data[id(f)]]) if id(f) in data else f)
+    ff_mule, ff_passthrough = (tmp_path / "mule").as_posix(), (tmp_path / "passthrough").as_posix()
+    # Written with mule when the new data is not given, copying the unchanged records otherwise
+    write_fields(mf_in, mf_out, um_file, ff_mule, None)
+    write_fields(mf_in, mf_out, um_file, ff_passthrough, replacements)
+    assert 'copying the unchanged fields' in capsys.readouterr().out
+    fields_mule = mule.load_umfile(ff_mule).fields
+    fields_passthrough = mule.load_umfile(ff_passthrough).fields
+    assert len(fields_passthrough) == len(fields_mule) == len(mf_in.fields)
+    for f_mule, f_passthrough in zip(fields_mule, fields_passthrough):
+        assert (f_passthrough.lbuser4, f_passthrough.lblev) == (f_mule.lbuser4, f_mule.lblev)
+        np.testing.assert_array_equal(f_passthrough.get_data(), f_mule.get_data())
+    np.testing.assert_array_equal(fields_passthrough[1].get_data(), 2. * mf_in.fields[1].get_data())
+    # The records stay aligned to the sectors of the FieldsFile written by mule, and the file validates as well
+    sector = np.gcd.reduce([f.lbnrec for f in mf_in.fields])
+    assert all(f.lbnrec % sector == 0 and (f.lbegin - fields_passthrough[0].lbegin) % sector == 0
+               for f in fields_passthrough)
+    assert validation_error(mule, ff_passthrough) == validation_error(mule, ff_mule)
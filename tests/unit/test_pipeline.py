@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+mule = pytest.importorskip("mule")
+
+from replace_landsurface.engine import ReplaceOperator
+from replace_landsurface.merge import merge_data
+from replace_landsurface.pipeline import FieldPipeline, StageTimer
+from replace_landsurface.records import read_field_data
+
+# Stages of the pipeline doing work (rather than waiting)
+STAGES = ('read', 'get_data', 'merge', 'write')
+
+
+def make_sources(mf_in):
+    """ Source data for the soil moisture and surface temperature fields, missing at the first point."""
+    sources = {}
+    for index, f in enumerate(mf_in.fields):
+        if f.lbuser4 in (9, 24):
+            data = np.full((f.lbrow, f.lbnpt), -float(index))
+            data[0, 0] = np.nan
+            sources[index] = data
+    return sources
+
+
+def write_serial(ff_in, ff_out, sources):
+    mf_in = mule.load_umfile(ff_in)
+    replace = ReplaceOperator()
+    mf_out = mf_in.copy()
+    for index, f in enumerate(mf_in.fields):
+        if index in sources:
+            f = replace([f, merge_data(read_field_data(f, ff_in), sources[index])])
+        mf_out.fields.append(f)
+    mf_out.validate = lambda *args, **kwargs: True
+    mf_out.to_file(ff_out)
+
+
+def write_pipelined(ff_in, ff_out, sources, read=None):
+    mf_in = mule.load_umfile(ff_in)
+    fp = FieldPipeline(ff_in, workers=2)
+    mf_out = mf_in.copy()
+    for index, f in enumerate(mf_in.fields):
+        if index in sources:
+            f = fp.replace(f, index, fp.read(read or sources.get, index), merge_data)
+        mf_out.fields.append(f)
+    return fp.write(mf_out, ff_out)
+
+
+def test_pipeline_matches_serial(um_file, tmp_path):
+    sources = make_sources(mule.load_umfile(um_file))
+    serial, pipelined = (tmp_path / "serial").as_posix(), (tmp_path / "pipelined").as_posix()
+    write_serial(um_file, serial, sources)
+    write_pipelined(um_file, pipelined, sources)
+    fields_in = mule.load_umfile(um_file).fields
+    fields_serial = mule.load_umfile(serial).fields
+    fields_pipelined = mule.load_umfile(pipelined).fields
+    # Same fields in the same order as the input file
+    assert [(f.lbuser4, f.lblev) for f in fields_pipelined] == [(f.lbuser4, f.lblev) for f in fields_in]
+    assert [(f.lbuser4, f.lblev) for f in fields_serial] == [(f.lbuser4, f.lblev) for f in fields_in]
+    for f_serial, f_pipelined in zip(fields_serial, fields_pipelined):
+        np.testing.assert_array_equal(f_pipelined.get_data(), f_serial.get_data())
+    # The source data was merged (keeping the current value where missing)
+    data = fields_pipelined[1].get_data()
+    assert data[0, 0] == fields_in[1].get_data()[0, 0]
+    np.testing.assert_array_equal(data.ravel()[1:], -1.)
+
+
+def test_pipeline_read_error(um_file, tmp_path):
+    def read(index):
+        if index == 2:
+            raise ValueError("read failed")
+        return sources[index]
+
+    sources = make_sources(mule.load_umfile(um_file))
+    # Write in a separate thread, so that a hanging merge fails the test rather than blocking it
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(write_pipelined, um_file, (tmp_path / "out").as_posix(), sources, read)
+    try:
+        with pytest.raises(ValueError, match="read failed"):
+            future.result(timeout=60)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def test_pipeline_times(um_file, tmp_path):
+    sources = make_sources(mule.load_umfile(um_file))
+    times = write_pipelined(um_file, (tmp_path / "out").as_posix(), sources)
+    assert set(STAGES) <= set(times)
+    assert 0. <= times['overlapped'] <= sum(times[stage] for stage in STAGES)
+    assert times['wall'] > 0.
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    threads = [threading.Thread(target=timer.timed, args=('read', sum, [1, 2])) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timer.timed('merge', sum, [1, 2]) == 3
+    assert sorted(timer.times) == ['merge', 'read']
+    assert timer.times['read'] >= 0.
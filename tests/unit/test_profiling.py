@@ -0,0 +1,71 @@
+import json
+import threading
+
+from replace_landsurface import profiling
+from replace_landsurface.profiling import profile, span, traced
+
+
+@traced('read', 'FIELDN')
+def read(ncfname, FIELDN):
+    with span('inner') as attrs:
+        attrs['points'] = 4
+    return FIELDN
+
+
+def read_spans(fname):
+    with open(fname) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_spans(tmp_path):
+    fname = tmp_path / 'profile.jsonl'
+    with profile(fname, 'hres_ic') as run_profile:
+        run_profile.record('imports', 1., 1.5)
+        with span('swap', type='era5land'):
+            assert read('file.nc', FIELDN='swvl1') == 'swvl1'
+        thread = threading.Thread(target=read, args=('file.nc', 'stl1'), name='reader')
+        thread.start()
+        thread.join()
+    spans = read_spans(fname)
+    assert [s['name'] for s in spans] == ['imports', 'inner', 'read', 'swap', 'inner', 'read']
+    assert len({s['run'] for s in spans}) == 1
+    assert all(s['command'] == 'hres_ic' for s in spans)
+    imports, inner, read_span, swap, thread_inner, thread_read = spans
+    assert imports['duration'] == 0.5
+    assert inner['parent'] == 'read' and inner['points'] == 4
+    assert read_span['parent'] == 'swap' and read_span['FIELDN'] == 'swvl1'
+    assert swap['parent'] is None and swap['type'] == 'era5land'
+    assert swap['duration'] >= read_span['duration']
+    # Spans of other threads are not nested in the spans of the main thread
+    assert thread_read['parent'] is None and thread_read['thread'] == 'reader'
+    assert thread_inner['parent'] == 'read'
+    assert profiling._profile is None
+
+
+def test_spans_appended(tmp_path):
+    fname = tmp_path / 'profile.jsonl'
+    for _ in range(2):
+        with profile(fname, 'hres_eccb'):
+            with span('swap'):
+                pass
+    spans = read_spans(fname)
+    assert len(spans) == 2
+    assert spans[0]['run'] != spans[1]['run']
+
+
+def test_no_profile(tmp_path):
+    with profile(None, 'hres_ic') as run_profile:
+        assert run_profile is None
+        with span('swap') as attrs:
+            attrs['file'] = 'astart'
+        assert read('file.nc', 'swvl1') == 'swvl1'
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cprofile(tmp_path):
+    import pstats
+
+    with profile(tmp_path / 'profile.jsonl', 'hres_ic', tmp_path / 'profile.prof'):
+        read('file.nc', 'swvl1')
+    stats = pstats.Stats((tmp_path / 'profile.prof').as_posix())
+    assert any(name == 'read' for _, _, name in stats.stats)
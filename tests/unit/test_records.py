@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from replace_landsurface.records import read_field_data
+
+
+def make_field(**kwargs):
+    header = dict(lbpack=0, lbuser1=1, lbext=0, lbegin=4, lbrow=2, lbnpt=3, lblrec=6)
+    header.update(kwargs)
+    return SimpleNamespace(get_data=lambda: 'read by mule', **header)
+
+
+def test_read_field_data(tmp_path):
+    fname = tmp_path / "file"
+    data = np.arange(6.).reshape(2, 3)
+    np.concatenate([np.zeros(4), data.ravel()]).astype('>f8').tofile(fname)
+    mapped = read_field_data(make_field(), fname)
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, data)
+
+
+def test_read_field_data_packed(tmp_path):
+    fname = tmp_path / "file"
+    np.zeros(10).tofile(fname)
+    # WGDOS packed, integer and extra data fields are read by mule
+    assert read_field_data(make_field(lbpack=1), fname) == 'read by mule'
+    assert read_field_data(make_field(lbuser1=2), fname) == 'read by mule'
+    assert read_field_data(make_field(lbext=2), fname) == 'read by mule'
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from replace_landsurface import server
+
+# Server handling a given number of jobs, then exiting
+SERVER_CODE = """
+import socketserver, sys
+from replace_landsurface import server
+with socketserver.UnixStreamServer(sys.argv[1], server._JobHandler) as s:
+    for _ in range(int(sys.argv[2])):
+        s.handle_request()
+"""
+
+
+@pytest.fixture
+def job_server(tmp_path, monkeypatch):
+    def start(njobs):
+        socket_path = (tmp_path / 'server.sock').as_posix()
+        process = subprocess.Popen([sys.executable, '-c', SERVER_CODE, socket_path, str(njobs)])
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.05)
+        monkeypatch.setenv(server.SERVER_ENV, socket_path)
+        return process
+    return start
+
+
+def test_submit(job_server, tmp_path, monkeypatch, capsys):
+    process = job_server(4)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'manifest').write_text('ec_cb000.tmp 202202260600\n')
+    status = server.submit('hres_ic', ['--mask', 'mask', '--file', 'astart.tmp', '--start', '202202260000', '--type', 'none'])
+    assert status == 0
+    out = capsys.readouterr().out
+    assert 'No need to swap out IC' in out
+    # Relative paths are in the working directory of the client
+    assert server.submit('hres_eccb', ['--mask', 'mask', '--manifest', 'manifest', '--type', 'none']) == 0
+    assert 'ec_cb000.tmp 20220226T0600Z' in capsys.readouterr().out
+    # Argument errors are reported to the client
+    assert server.submit('hres_eccb', ['--mask', 'mask']) == 2
+    assert 'either --file and --start or --manifest are required' in capsys.readouterr().err
+    assert server.submit('unknown', []) == 1
+    assert 'Unknown command' in capsys.readouterr().err
+    process.wait(timeout=10)
+
+
+def test_submit_without_server(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv(server.SERVER_ENV, raising=False)
+    assert server.submit('hres_ic', []) is None
+    monkeypatch.setenv(server.SERVER_ENV, (tmp_path / 'missing.sock').as_posix())
+    assert server.submit('hres_ic', []) is None
+    assert 'running the job locally' in capsys.readouterr().err